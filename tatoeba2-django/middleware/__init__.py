@@ -1,5 +1,7 @@
 from django.http import HttpResponse
 from django.conf import settings
+from tatoeba2 import instrumentation
+from time import time
 
 CORS_ALLOW_ORIGIN = getattr(settings, 'CORS_ALLOW_ORIGIN', '*')
 CORS_ALLOW_METHODS = getattr(settings, 'CORS_ALLOW_METHODS', ['POST', 'GET', 'PUT', 'DELETE', 'OPTIONS'])
@@ -21,3 +23,42 @@ class CorsMiddleware(object):
 
     def process_response(self, request, response):
         return self._set_headers(response)
+
+
+CALL_NAMES = {'sql': 'queries', 'xapian': 'searches'}
+
+class InstrumentationMiddleware(object):
+    """
+    Times each request and the phases wrapped in
+    tatoeba2.instrumentation.timed (SQL queries, Xapian searches,
+    stemming, serialization), sends them in a Server-Timing header and
+    adds them to the per-resource histograms.
+    """
+
+    def process_request(self, request):
+        request._instrumentation_started = time()
+        instrumentation.start()
+
+    def process_response(self, request, response):
+        if not hasattr(request, '_instrumentation_started'):
+            return response
+
+        timings, calls = instrumentation.stop()
+        timings['total'] = time() - request._instrumentation_started
+
+        response['Server-Timing'] = ', '.join(
+            '%s;dur=%.2f%s' % (
+                phase, seconds * 1000,
+                ';desc="%d %s"' % (calls[phase], CALL_NAMES[phase])
+                if phase in CALL_NAMES and phase in calls else ''
+                )
+            for phase, seconds in sorted(timings.items())
+            )
+
+        match = getattr(request, 'resolver_match', None)
+        resource = match.kwargs.get('resource_name') if match else None
+
+        if resource:
+            instrumentation.recorder.record(resource, timings)
+
+        return response
@@ -0,0 +1,23 @@
+"""
+Settings for running the benchmark suite against a local SQLite
+database and a separate Xapian index:
+
+  ./manage.py generate_benchmark_data --settings=tatoeba2-django.benchmark_settings
+  ./manage.py run_benchmarks --settings=tatoeba2-django.benchmark_settings
+"""
+from .settings import *
+
+DEBUG = False
+
+ALLOWED_HOSTS = ['*']
+
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.path.join(BASE_DIR, 'benchmark.db'),
+    }
+}
+
+MANAGE_DB = True
+
+HAYSTACK_CONNECTIONS['default']['PATH'] = os.path.join(BASE_DIR, 'benchmark_index')
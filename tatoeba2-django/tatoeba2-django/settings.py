@@ -82,7 +82,7 @@ HAYSTACK_STEMMERS = {
 
 HAYSTACK_CONNECTIONS = {
     'default': {
-        'ENGINE': 'xapian_backend.XapianEngine',
+        'ENGINE': 'tatoeba2.backends.XapianEngine',
         'PATH': os.path.join(BASE_DIR, 'xapian_index'),
         'HAYSTACK_XAPIAN_STEMMING_STRATEGY': 'STEM_NONE',
     },
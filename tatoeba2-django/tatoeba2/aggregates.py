@@ -0,0 +1,82 @@
+from django.db import connection, transaction
+from .models import SentencesTranslationAggregates
+
+
+TABLE = SentencesTranslationAggregates._meta.db_table
+
+COLUMNS = """
+    `sentence_id`, `trans_langs`, `trans_owners`,
+    `trans_has_audio`, `trans_is_unapproved`, `trans_has_orphan`
+"""
+
+# One row per sentence having translations, computed with the same rules
+# as SentencesIndex.prepare used to apply to the raw join.
+AGGREGATE_SQL = """
+    SELECT `t`.`sentence_id`,
+           GROUP_CONCAT(DISTINCT IF(`s`.`lang` IS NULL OR `s`.`lang` = '', 'und', `s`.`lang`)
+                        SEPARATOR ' | '),
+           COALESCE(GROUP_CONCAT(DISTINCT `u`.`username` ORDER BY `u`.`id`
+                                 SEPARATOR ' | '), ''),
+           MAX(`s`.`hasaudio` IN ('shtooka', 'from_users')),
+           COALESCE(MAX(`s`.`correctness` = -1), 0),
+           MAX(`s`.`user_id` IS NULL)
+    FROM `sentences_translations` as `t`
+    JOIN `sentences` as `s`
+    ON `s`.`id` = `t`.`translation_id`
+    LEFT JOIN `users` as `u`
+    ON `u`.`id` = `s`.`user_id`
+    %s
+    GROUP BY `t`.`sentence_id`
+"""
+
+GROUP_CONCAT_MAX_LEN = 1024 * 1024
+
+
+def ensure_table():
+    if TABLE not in connection.introspection.table_names():
+        with connection.schema_editor() as editor:
+            editor.create_model(SentencesTranslationAggregates)
+
+
+def rebuild_translation_aggregates():
+    """
+    Recomputes the whole table in one grouped pass into a new table and
+    swaps it in, so readers never see a partially filled table.
+    """
+    ensure_table()
+    cursor = connection.cursor()
+    cursor.execute('SET SESSION group_concat_max_len = %s', [GROUP_CONCAT_MAX_LEN])
+    cursor.execute('DROP TABLE IF EXISTS `%s_new`' % TABLE)
+    cursor.execute('CREATE TABLE `%s_new` LIKE `%s`' % (TABLE, TABLE))
+    cursor.execute('INSERT INTO `%s_new` (%s) %s' % (
+        TABLE, COLUMNS, AGGREGATE_SQL % ''))
+    count = cursor.rowcount
+    cursor.execute('RENAME TABLE `%s` TO `%s_old`, `%s_new` TO `%s`' % (
+        TABLE, TABLE, TABLE, TABLE))
+    cursor.execute('DROP TABLE `%s_old`' % TABLE)
+
+    return count
+
+
+def refresh_translation_aggregates(sentence_ids, batch_size=1000):
+    """
+    Recomputes the rows of the given sentences, e.g. after their links or
+    their translations changed.
+    """
+    sentence_ids = sorted(set(sentence_ids))
+    cursor = connection.cursor()
+    cursor.execute('SET SESSION group_concat_max_len = %s', [GROUP_CONCAT_MAX_LEN])
+
+    for start in range(0, len(sentence_ids), batch_size):
+        ids = sentence_ids[start:start + batch_size]
+        placeholders = ', '.join(['%s'] * len(ids))
+
+        with transaction.atomic():
+            cursor.execute(
+                'DELETE FROM `%s` WHERE `sentence_id` IN (%s)' % (TABLE, placeholders),
+                ids)
+            cursor.execute(
+                'INSERT INTO `%s` (%s) %s' % (
+                    TABLE, COLUMNS,
+                    AGGREGATE_SQL % ('WHERE `t`.`sentence_id` IN (%s)' % placeholders)),
+                ids)
@@ -1,9 +1,12 @@
 from tastypie import fields
-from tastypie.resources import ModelResource, ALL
+from tastypie.resources import ALL
 from tastypie.authorization import Authorization
-from .api_base import BaseSearchResource, UCharField, IDPaginator
+from .api_base import (
+    BaseSearchResource, BaseModelResource, UCharField, IDPaginator
+    )
+from .autocomplete import PrefixIndex
 from .models import (
-    Sentences, Tags, TagsSentences, Users
+    Sentences, Tags, TagsSentences, Users, SentencesLists
     )
 from .search_indexes import (
     SentencesIndex, TagsIndex, SentencesListsIndex, SentenceCommentsIndex,
@@ -52,7 +55,7 @@ def set_search_filters(resource, exclude=[]):
     resource._meta.filtering = filtering
 
 
-class SentencesResource(ModelResource):
+class SentencesResource(BaseModelResource):
     created = fields.DateTimeField(attribute='created', default=datetime(1, 1, 1))
     modified = fields.DateTimeField(attribute='modified', default=datetime(1, 1, 1))
     text = UCharField(attribute='text')
@@ -64,6 +67,8 @@ class SentencesResource(ModelResource):
         authorization = Authorization()
         paginator_class = IDPaginator
         max_limit = 100
+        etag_fields = ['id', 'modified']
+        last_modified_field = 'modified'
 
 set_filters(SentencesResource, exclude=['text'])
 
@@ -78,12 +83,14 @@ class SentencesSearchResource(BaseSearchResource):
             'trans_langs', 'trans_owners'
             ]
         stem_fields = ['sentence_text_stemmed']
+        facet_fields = ['lang', 'has_audio', 'is_unapproved', 'is_orphan', 'tags']
+        facet_separators = {'tags': ' | '}
         allowed_methods = ['get']
 
 set_search_filters(SentencesSearchResource)
 
 
-class TagsResource(ModelResource):
+class TagsResource(BaseModelResource):
     created = fields.DateTimeField(attribute='created', default=datetime(1, 1, 1))
     description = UCharField(attribute='description', default='')
 
@@ -98,7 +105,7 @@ class TagsResource(ModelResource):
 set_filters(TagsResource, exclude=['name', 'description'])
 
 
-class TagsSentencesResource(ModelResource):
+class TagsSentencesResource(BaseModelResource):
     added_time = fields.DateTimeField(attribute='added_time', default=datetime(1, 1, 1))
     sentence = fields.ForeignKey('tatoeba2.api.SentencesResource', attribute='sentence')
     user = fields.ForeignKey('tatoeba2.api.UsersResource', attribute='user')
@@ -111,6 +118,8 @@ class TagsSentencesResource(ModelResource):
         authorization = Authorization()
         paginator_class = IDPaginator
         max_limit = 100
+        etag_fields = ['id', 'added_time']
+        last_modified_field = 'added_time'
 
 set_filters(TagsSentencesResource, exclude=['name', 'description'])
 
@@ -123,6 +132,7 @@ class TagsSearchResource(BaseSearchResource):
             'name', 'user'
             ]
         autocomplete_fields = ['name_ngram']
+        prefix_index = PrefixIndex(Tags, 'name_ngram', 'name', 'nbrofsentences')
         allowed_methods = ['get']
 
 set_search_filters(TagsSearchResource)
@@ -136,6 +146,9 @@ class SentencesListsSearchResource(BaseSearchResource):
             'name', 'user'
             ]
         autocomplete_fields = ['name_ngram']
+        prefix_index = PrefixIndex(
+            SentencesLists, 'name_ngram', 'name', 'numberofsentences'
+            )
         allowed_methods = ['get']
 
 set_search_filters(SentencesListsSearchResource)
@@ -165,7 +178,7 @@ class WallSearchResource(BaseSearchResource):
 set_search_filters(WallSearchResource)
 
 
-class UsersResource(ModelResource):
+class UsersResource(BaseModelResource):
     since = fields.DateTimeField(attribute='since', default=datetime(1, 1, 1))
     birthday = fields.DateTimeField(attribute='since', default=datetime(1, 1, 1))
 
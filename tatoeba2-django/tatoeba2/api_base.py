@@ -1,11 +1,30 @@
-from tastypie.resources import Resource, DeclarativeMetaclass, ResourceOptions
+from tastypie.resources import (
+    Resource, ModelResource, DeclarativeMetaclass, ResourceOptions
+    )
 from tastypie import fields
 from tastypie.paginator import Paginator
-from tastypie.exceptions import InvalidFilterError, InvalidSortError
+from tastypie.exceptions import (
+    InvalidFilterError, InvalidSortError, BadRequest, ImmediateHttpResponse
+    )
+from haystack.exceptions import SearchFieldError
+from haystack.fields import DateTimeField
 from haystack.query import SearchQuerySet, AutoQuery, SQ
-from .utils import stemmer, uclean
-from django.db import connection
+from .utils import stemmer, uclean, LRUCache, queryset_batches
+from .counts import count
+from .generations import index_generation
+from .instrumentation import timed
+from .slow_searches import watch, note_query
+from django.conf import settings
 from django.core.urlresolvers import reverse
+from django.db.models import Prefetch
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils.http import quote_etag
+from django.utils.text import compress_sequence
+from django.views.decorators.http import condition
+from datetime import datetime, date
+from hashlib import md5
+import base64
+import json
 
 
 class UCharField(fields.ApiField):
@@ -27,35 +46,42 @@ class IDPaginator(Paginator):
 
         return list(self.objects.order_by('id').filter(id__gte=offset)[:limit])
 
-    def get_count(self):
-        query = self.objects.query
+    count_with_mode = None
 
-        query, params = query.sql_with_params()
-        query = 'EXPLAIN %s' % query
+    def get_count(self):
+        return self.get_count_with_mode()[0]
 
-        cursor = connection.cursor()
-        cursor.execute(query, params)
-        count = cursor.fetchone()[-2]
+    def get_count_with_mode(self):
+        if self.count_with_mode is None:
+            self.count_with_mode = count(self.objects)
 
-        return count
+        return self.count_with_mode
 
     def get_next(self, limit, offset):
         return self._generate_uri(limit, offset)
 
+    def get_slice_values(self, limit, offset, fields):
+        objects = self.objects.order_by('id').filter(id__gte=offset)
+
+        if limit == 0:
+            return list(objects.values_list(*fields))
+
+        return list(objects.values_list(*fields)[:limit])
+
     def page(self):
         limit = self.get_limit()
         offset = self.get_offset()
-        count = self.get_count()
+        count, count_mode = self.get_count_with_mode()
         objects = self.get_slice(limit, offset)
-        next_offset = objects[-1].id
         meta = {
             'offset': offset,
             'limit': limit,
             'total_count': count,
+            'count_mode': count_mode,
         }
 
-        if limit:
-            meta['next'] = self.get_next(limit, next_offset)
+        if limit and objects:
+            meta['next'] = self.get_next(limit, objects[-1].id)
 
         return {
             self.collection_name: objects,
@@ -63,6 +89,511 @@ class IDPaginator(Paginator):
         }
 
 
+def make_etag(*parts):
+    return md5(repr(parts)).hexdigest()
+
+
+def conditional_response(view, request, etag, last_modified=None, **kwargs):
+    """
+    Returns 304 when the request's If-None-Match/If-Modified-Since match
+    `etag`/`last_modified`, calls `view` otherwise. Either way the
+    response carries the validators.
+    """
+    if isinstance(last_modified, date) and not isinstance(last_modified, datetime):
+        last_modified = datetime(last_modified.year, last_modified.month, last_modified.day)
+
+    return condition(
+        etag_func=lambda request, **kwargs: etag,
+        last_modified_func=lambda request, **kwargs: last_modified,
+        )(view)(request, **kwargs)
+
+
+def requested_fields(request):
+    """
+    Returns the set of names listed in the `fields` parameter of
+    `request`, or None when all fields are wanted.
+    """
+    value = getattr(request, 'GET', {}).get('fields', '')
+    names = set(name.strip() for name in value.split(',')) - set([''])
+
+    return names or None
+
+
+class SparseFieldsMixin(object):
+    """
+    Only dehydrates the fields listed in the `fields` query parameter,
+    e.g. `?fields=id,text,lang`.
+    """
+
+    def get_requested_fields(self, request):
+        names = requested_fields(request)
+
+        if names is None:
+            return None
+
+        unknown = names - set(self.fields)
+        if unknown:
+            raise BadRequest("Unknown fields: %s." % ', '.join(sorted(unknown)))
+
+        return names
+
+    def full_dehydrate(self, bundle, for_list=False):
+        names = self.get_requested_fields(bundle.request)
+
+        if names is None:
+            return super(SparseFieldsMixin, self).full_dehydrate(bundle, for_list)
+
+        use_in = ['all', 'list' if for_list else 'detail']
+
+        # Same as Resource.full_dehydrate, skipping the fields not asked for.
+        for field_name, field_object in self.fields.items():
+            if field_name not in names:
+                continue
+
+            field_use_in = getattr(field_object, 'use_in', 'all')
+            if callable(field_use_in):
+                if not field_use_in(bundle):
+                    continue
+            elif field_use_in not in use_in:
+                continue
+
+            if getattr(field_object, 'dehydrated_type', None) == 'related':
+                field_object.api_name = self._meta.api_name
+                field_object.resource_name = self._meta.resource_name
+
+            bundle.data[field_name] = field_object.dehydrate(bundle, for_list=for_list)
+
+            method = getattr(self, 'dehydrate_%s' % field_name, None)
+            if method:
+                bundle.data[field_name] = method(bundle)
+
+        return self.dehydrate(bundle)
+
+
+class TimingMixin(object):
+    """
+    Accounts serialization time to the request instrumentation.
+    """
+
+    def serialize(self, request, data, format, options=None):
+        with timed('serialize'):
+            return super(TimingMixin, self).serialize(request, data, format, options)
+
+
+class MultiGetMixin(object):
+    """
+    Serves `<resource>/set/<id>;<id>;.../` with a single lookup for all
+    the ids, returned in the requested order. Subclasses provide
+    `get_multiple_objects`.
+    """
+
+    def get_multiple(self, request, **kwargs):
+        self.method_check(request, allowed=['get'])
+        self.is_authenticated(request)
+        self.throttle_check(request)
+
+        kwarg_name = '%s_list' % self._meta.detail_uri_name
+        identifiers = kwargs.get(kwarg_name, '').split(';')
+
+        if self._meta.max_limit and len(identifiers) > self._meta.max_limit:
+            raise BadRequest('At most %d ids can be requested at once.' % self._meta.max_limit)
+
+        ids = {}
+        for identifier in identifiers:
+            try:
+                ids[identifier] = int(identifier)
+            except ValueError:
+                pass
+
+        base_bundle = self.build_bundle(request=request)
+        found = self.get_multiple_objects(base_bundle, set(ids.values()))
+        objects = []
+        not_found = []
+
+        for identifier in identifiers:
+            obj = found.get(ids.get(identifier))
+
+            if obj is None:
+                not_found.append(identifier)
+                continue
+
+            bundle = self.build_bundle(obj=obj, request=request)
+            objects.append(self.full_dehydrate(bundle, for_list=True))
+
+        object_list = {
+            self._meta.collection_name: objects,
+        }
+
+        if not_found:
+            object_list['not_found'] = not_found
+
+        self.log_throttled_access(request)
+        return self.create_response(request, object_list)
+
+
+class BaseModelResource(TimingMixin, MultiGetMixin, SparseFieldsMixin, ModelResource):
+    """
+    ModelResource answering conditional GETs from a light query on
+    `Meta.etag_fields` (the exposed columns by default) instead of loading
+    and serializing the objects. Details also get a Last-Modified from
+    `Meta.last_modified_field` when set.
+
+    With a `fields` parameter, only the columns behind the listed fields
+    are selected. With `format=ndjson`, lists are streamed in full as one
+    JSON object per line.
+
+    Objects behind related fields are loaded for the whole page with one
+    query per field instead of one per row.
+    """
+
+    def get_columns(self, names):
+        """
+        Returns the model fields read by the resource fields `names`.
+        """
+        attributes = set(getattr(self.fields[name], 'attribute', None) for name in names)
+
+        return [
+            f.name for f in self._meta.object_class._meta.concrete_fields
+            if f.name in attributes
+            ]
+
+    def get_prefetches(self, names=None):
+        prefetches = []
+
+        for name, field in self.fields.items():
+            if not getattr(field, 'is_related', False):
+                continue
+            if names is not None and name not in names:
+                continue
+            if not isinstance(field.attribute, basestring):
+                continue
+
+            queryset = field.to_class()._meta.queryset._clone()
+
+            # Without full=True only the primary key is needed to build
+            # the resource URI.
+            if not field.full:
+                queryset = queryset.only('pk')
+
+            prefetches.append(Prefetch(field.attribute, queryset=queryset))
+
+        return prefetches
+
+    def get_object_list(self, request):
+        objects = super(BaseModelResource, self).get_object_list(request)
+        names = self.get_requested_fields(request)
+        prefetches = self.get_prefetches(names)
+
+        if prefetches:
+            objects = objects.prefetch_related(*prefetches)
+
+        if names is None:
+            return objects
+
+        # The ETag of a list is computed from the loaded page.
+        return objects.only(*set(self.get_columns(names) + self.get_etag_fields(request)))
+
+    def get_etag_fields(self, request):
+        fields = getattr(self._meta, 'etag_fields', None)
+
+        if fields:
+            return list(fields)
+
+        columns = self.get_columns(self.get_requested_fields(request) or self.fields)
+
+        return ['id'] + [column for column in columns if column != 'id']
+
+    def get_list(self, request, **kwargs):
+        if request.GET.get('format') == 'ndjson':
+            # Resource.dispatch replaces anything that isn't an HttpResponse
+            # with a 204, streaming responses included.
+            raise ImmediateHttpResponse(response=self.export_list(request, **kwargs))
+
+        base_bundle = self.build_bundle(request=request)
+        objects = self.obj_get_list(bundle=base_bundle, **self.remove_api_resource_names(kwargs))
+        objects = self.apply_sorting(objects, options=request.GET)
+        paginator = self._meta.paginator_class(
+            request.GET, objects, resource_uri=self.get_resource_uri(),
+            limit=self._meta.limit, max_limit=self._meta.max_limit,
+            collection_name=self._meta.collection_name)
+        fields = self.get_etag_fields(request)
+
+        if not ('HTTP_IF_NONE_MATCH' in request.META or
+                'HTTP_IF_MODIFIED_SINCE' in request.META):
+            return self.get_list_response(request, paginator, fields)
+
+        # Only the ETag columns of the page are read to decide on a 304,
+        # the paginator keeps the count for the full response.
+        rows = paginator.get_slice_values(
+            paginator.get_limit(), paginator.get_offset(), fields)
+
+        return conditional_response(
+            lambda request, **kwargs: self.get_list_response(request, paginator, fields),
+            request, self.get_list_etag(request, paginator.get_count(), rows),
+            **kwargs)
+
+    def get_list_etag(self, request, count, rows):
+        return make_etag(
+            self.determine_format(request), sorted(requested_fields(request) or []),
+            count, rows)
+
+    def get_list_response(self, request, paginator, etag_fields):
+        """
+        Same as Resource.get_list from the paginator on, with the ETag
+        computed from the page's objects.
+        """
+        to_be_serialized = paginator.page()
+        objects = to_be_serialized[self._meta.collection_name]
+        rows = [tuple(obj.serializable_value(field) for field in etag_fields) for obj in objects]
+        etag = self.get_list_etag(request, to_be_serialized['meta']['total_count'], rows)
+
+        to_be_serialized[self._meta.collection_name] = [
+            self.full_dehydrate(self.build_bundle(obj=obj, request=request), for_list=True)
+            for obj in objects
+            ]
+        to_be_serialized = self.alter_list_data_to_serialize(request, to_be_serialized)
+
+        response = self.create_response(request, to_be_serialized)
+        response['ETag'] = quote_etag(etag)
+
+        return response
+
+    def export_list(self, request, **kwargs):
+        """
+        Streams every object of the filtered list from `offset` (an id, as
+        with IDPaginator) on, reading the table in keyset batches so memory
+        use doesn't depend on the size of the result. The stream is
+        gzipped when the client accepts it.
+        """
+        base_bundle = self.build_bundle(request=request)
+        objects = self.obj_get_list(bundle=base_bundle, **self.remove_api_resource_names(kwargs))
+
+        try:
+            offset = int(request.GET.get('offset', 0))
+        except ValueError:
+            raise BadRequest("Invalid offset '%s'." % request.GET['offset'])
+
+        def lines():
+            for batch in queryset_batches(objects.filter(id__gte=offset), EXPORT_BATCH_SIZE):
+                for obj in batch:
+                    bundle = self.full_dehydrate(
+                        self.build_bundle(obj=obj, request=request), for_list=True)
+                    yield self._meta.serializer.to_json(bundle).encode('utf-8') + '\n'
+
+        content = lines()
+        gzipped = 'gzip' in request.META.get('HTTP_ACCEPT_ENCODING', '')
+
+        if gzipped:
+            content = compress_sequence(content)
+
+        response = StreamingHttpResponse(content, content_type='application/x-ndjson')
+        response['Vary'] = 'Accept-Encoding'
+
+        if gzipped:
+            response['Content-Encoding'] = 'gzip'
+
+        return response
+
+    def get_multiple_objects(self, base_bundle, ids):
+        objects = self.get_object_list(base_bundle.request).filter(pk__in=ids)
+        objects = self.authorized_read_list(objects, base_bundle)
+
+        return dict((obj.pk, obj) for obj in objects)
+
+    def get_detail(self, request, **kwargs):
+        fields = self.get_etag_fields(request)
+        last_modified_field = getattr(self._meta, 'last_modified_field', None)
+        etag = last_modified = None
+
+        if last_modified_field and last_modified_field not in fields:
+            fields.append(last_modified_field)
+
+        try:
+            rows = list(
+                self.get_object_list(request)\
+                    .filter(**self.remove_api_resource_names(kwargs))\
+                    .values_list(*fields)[:2]
+                )
+        except (ValueError, TypeError):
+            rows = []
+
+        # Missing or ambiguous objects get the usual error response.
+        if len(rows) == 1:
+            etag = make_etag(
+                self.determine_format(request), sorted(requested_fields(request) or []), rows[0])
+            if last_modified_field:
+                last_modified = rows[0][fields.index(last_modified_field)]
+
+        return conditional_response(
+            super(BaseModelResource, self).get_detail, request, etag,
+            last_modified, **kwargs)
+
+
+def encode_cursor(value, django_id):
+    if isinstance(value, datetime):
+        key = {'datetime': value.isoformat()}
+    else:
+        key = {'value': value}
+
+    key['django_id'] = int(django_id)
+
+    return base64.urlsafe_b64encode(json.dumps(key)).rstrip('=')
+
+
+def decode_cursor(token):
+    try:
+        data = token.encode('ascii')
+        key = json.loads(base64.urlsafe_b64decode(data + '=' * (-len(data) % 4)))
+        django_id = int(key['django_id'])
+
+        if 'datetime' in key:
+            return DateTimeField().convert(key['datetime']), django_id
+    except (TypeError, ValueError, KeyError, SearchFieldError):
+        # UnicodeError is a ValueError: non-ASCII tokens end up here too.
+        raise BadRequest("Invalid cursor '%s'." % token)
+
+    return key.get('value'), django_id
+
+
+class SearchPaginator(Paginator):
+    """
+    Offset paginator that switches to keyset pagination when the request
+    has a `cursor` parameter (empty for the first page). Results are then
+    ordered by the requested sort key and django_id, and each page starts
+    after the last result of the previous one instead of skipping
+    `offset` matches.
+
+    The field facet counts of the query, if it has any, are added to the
+    meta as `facets`.
+    """
+
+    def page(self):
+        cursor = self.request_data.get('cursor')
+
+        if cursor is None:
+            output = super(SearchPaginator, self).page()
+        else:
+            output = self.cursor_page(cursor)
+
+        facets = self.get_facet_counts()
+        if facets is not None:
+            output['meta']['facets'] = facets
+
+        return output
+
+    def cursor_page(self, cursor):
+        limit = self.get_limit()
+        sort_field = (self.objects.query.order_by or [None])[0]
+        objects = self.objects.order_by('django_id')
+
+        if cursor:
+            objects = objects.filter(self.after(sort_field, *decode_cursor(cursor)))
+
+        results = list(objects[:limit] if limit else objects)
+        meta = {
+            'limit': limit,
+            'total_count': self.get_count(),
+            'cursor': cursor,
+            'next': None,
+        }
+
+        if limit and len(results) == limit:
+            last = results[-1]
+            value = getattr(last, sort_field.lstrip('-'), None) if sort_field else None
+            meta['next'] = self.get_cursor_uri(limit, encode_cursor(value, last.django_id))
+
+        return {
+            self.collection_name: results,
+            'meta': meta,
+        }
+
+    def after(self, sort_field, value, django_id):
+        after_id = SQ(django_id__gt=django_id)
+
+        if not sort_field:
+            return after_id
+
+        if sort_field.startswith('-'):
+            field = sort_field[1:]
+            beyond = SQ(**{field + '__lt': value})
+        else:
+            field = sort_field
+            beyond = SQ(**{field + '__gt': value})
+
+        # Datetimes are indexed as a date term and a time term, and an
+        # __exact filter only requires the date one: compare their value
+        # instead, whose resolution is the second.
+        if isinstance(value, datetime):
+            same = SQ(**{field + '__gte': value}) & SQ(**{field + '__lte': value})
+        else:
+            same = SQ(**{field + '__exact': value})
+
+        return beyond | (same & after_id)
+
+    def get_facet_counts(self):
+        query = getattr(self.objects, 'query', None)
+
+        if query is None or not query.facets:
+            return None
+
+        # The page and the count have usually run the query already; if
+        # not, run it for a single result.
+        if not query.has_run():
+            query = query._clone()
+            query.set_limits(0, 1)
+
+        return query.get_facet_counts().get('fields', {})
+
+    def get_cursor_uri(self, limit, cursor):
+        if self.resource_uri is None:
+            return None
+
+        params = self.request_data.copy()
+        for key in ('limit', 'offset', 'cursor'):
+            if key in params:
+                del params[key]
+        params.update({'limit': limit, 'cursor': cursor})
+
+        return '%s?%s' % (self.resource_uri, params.urlencode())
+
+
+SEARCH_CACHE_SIZE = getattr(settings, 'API_SEARCH_CACHE_SIZE', 10000)
+# Bound on the total size of the cached response bodies.
+SEARCH_CACHE_BYTES = getattr(settings, 'API_SEARCH_CACHE_BYTES', 64 * 1024 * 1024)
+FACET_CACHE_SIZE = getattr(settings, 'API_FACET_CACHE_SIZE', 100)
+EXPORT_BATCH_SIZE = getattr(settings, 'API_EXPORT_BATCH_SIZE', 1000)
+
+
+class SearchResponseCache(object):
+    """
+    LRU cache of serialized search responses, emptied whenever the index
+    generation changes.
+    """
+
+    def __init__(self, size, max_bytes=None, weigh=len):
+        self.responses = LRUCache(size, max_bytes, weigh)
+        self.generation = None
+
+    def get(self, key, generation):
+        if generation != self.generation:
+            self.responses.clear()
+            self.generation = generation
+
+        return self.responses.get(key)
+
+    def set(self, key, generation, response):
+        if generation == self.generation:
+            self.responses.set(key, response)
+
+    def stats(self):
+        return self.responses.stats()
+
+
+search_cache = SearchResponseCache(
+    SEARCH_CACHE_SIZE, SEARCH_CACHE_BYTES, weigh=lambda response: len(response[0]))
+facet_cache = SearchResponseCache(FACET_CACHE_SIZE)
+
+
 LOOKUP_SEP = '__'
 
 class SearchOptions(ResourceOptions):
@@ -76,6 +607,10 @@ class SearchOptions(ResourceOptions):
     autocomplete_fields = []
     stem_fields = []
     max_limit = 100
+    paginator_class = SearchPaginator
+    facet_fields = []
+    facet_separators = {}
+    prefix_index = None
 
 
 class SearchDeclarativeMetaclass(DeclarativeMetaclass):
@@ -113,7 +648,7 @@ class SearchDeclarativeMetaclass(DeclarativeMetaclass):
         return new_class
 
 
-class BaseSearchResource(Resource):
+class BaseSearchResource(TimingMixin, MultiGetMixin, SparseFieldsMixin, Resource):
     __metaclass__ = SearchDeclarativeMetaclass
 
     django_id = fields.IntegerField(attribute='django_id')
@@ -208,7 +743,8 @@ class BaseSearchResource(Resource):
             filter_value = self.filter_value_to_python(filter_type, value)
 
             if field_name in self._meta.stem_fields and stem_lang:
-                filter_value = stemmer.stem(filter_value, stem_lang)
+                with timed('stem'):
+                    filter_value = stemmer.stem(filter_value, stem_lang)
 
             if field_name in self._meta.autoquery_fields:
                 filter_value = AutoQuery(filter_value)
@@ -218,7 +754,7 @@ class BaseSearchResource(Resource):
 
         return applicable_filters
 
-    def apply_filters(self, request, filters=None, join_op='and'):
+    def combine_filters(self, filters, join_op='and'):
         SQ = self._meta.object_query
         query = SQ()
 
@@ -234,9 +770,42 @@ class BaseSearchResource(Resource):
             for fltr, val in filters.items():
                 query = query & ~SQ(**{fltr: val})
 
-        result = self.get_object_list(request).filter(query)
+        return query
 
-        return result
+    def apply_filters(self, request, filters=None, join_op='and'):
+        return self.get_object_list(request).filter(self.combine_filters(filters, join_op))
+
+    def autocomplete_query(self, sqs, filters):
+        # Same bits as SearchQuerySet.autocomplete, as an SQ.
+        SQ = self._meta.object_query
+        query = SQ()
+
+        for fltr, val in filters.items():
+            for word in val.split(' '):
+                bit = sqs.query.clean(word.strip())
+                if bit:
+                    query = query & SQ(**{fltr: bit})
+
+        return query
+
+    def compile_query(self, sqs, autocomp_filters, and_filters, or_filters, not_filters):
+        """
+        Builds the single SQ tree of a request:
+        ((autocomplete AND and_filters) OR or_filters) AND NOT not_filters.
+        """
+        query = self.autocomplete_query(sqs, autocomp_filters)
+
+        if and_filters:
+            stem_lang = and_filters.get('lang') or ''
+            query = query & self.combine_filters(self.build_filters(and_filters, stem_lang))
+
+        if or_filters:
+            query = query | self.combine_filters(self.build_filters(or_filters), 'or')
+
+        if not_filters:
+            query = query & self.combine_filters(self.build_filters(not_filters), 'not')
+
+        return query
 
     def apply_sort(self, obj_list, sort_expr):
         field_name = sort_expr[1:] if sort_expr.startswith('-') else sort_expr
@@ -252,9 +821,63 @@ class BaseSearchResource(Resource):
     def get_object_list(self, request):
         return self._meta.object_class().models(self._meta.model)
 
-    def obj_get_list(self, request=None, **kwargs):
+    def get_list(self, request, **kwargs):
+        generation = index_generation(settings.HAYSTACK_CONNECTIONS['default']['PATH'])
+        key = self.response_cache_key(request)
+
+        def view(request, **kwargs):
+            return self.get_cached_list(request, generation, key, **kwargs)
+
+        with watch(self._meta.resource_name, request):
+            return conditional_response(
+                view, request, make_etag(generation, key),
+                self.index_last_modified(generation), **kwargs)
+
+    def get_detail(self, request, **kwargs):
+        generation = index_generation(settings.HAYSTACK_CONNECTIONS['default']['PATH'])
+        key = self.response_cache_key(request) + (sorted(kwargs.items()),)
+
+        return conditional_response(
+            super(BaseSearchResource, self).get_detail, request,
+            make_etag(generation, key), self.index_last_modified(generation),
+            **kwargs)
+
+    def index_last_modified(self, generation):
+        stamp = generation[1]
+        return datetime.utcfromtimestamp(stamp) if stamp else None
+
+    def get_cached_list(self, request, generation, key, **kwargs):
+        if not SEARCH_CACHE_SIZE:
+            return super(BaseSearchResource, self).get_list(request, **kwargs)
+
+        cached = search_cache.get(key, generation)
+
+        if cached is not None:
+            content, content_type = cached
+            return HttpResponse(content, content_type=content_type)
+
+        response = super(BaseSearchResource, self).get_list(request, **kwargs)
+
+        if response.status_code == 200:
+            search_cache.set(key, generation, (response.content, response['Content-Type']))
+
+        return response
+
+    def response_cache_key(self, request):
+        # Filters keep their |/~ prefixes; order_by, limit, offset, cursor
+        # and format are part of the key like any other parameter.
+        params = tuple(sorted(
+            (key, tuple(values)) for key, values in request.GET.lists()
+            ))
+
+        return self._meta.resource_name, self.determine_format(request), params
+
+    def parse_filters(self, request):
+        """
+        Splits the query parameters of `request` into the sort expression
+        and the autocomplete, and, or (`|`) and not (`~`) filters.
+        """
         filters = {}
-        request = kwargs['bundle'].request
 
         if hasattr(request, 'GET'):
             filters = request.GET.copy()
@@ -266,9 +889,12 @@ class BaseSearchResource(Resource):
         sort_expr = filters.get('order_by')
         if sort_expr: del filters['order_by']
 
-        del filters['format']
+        if 'format' in filters.keys(): del filters['format']
         if 'offset' in filters.keys(): del filters['offset']
         if 'limit' in filters.keys(): del filters['limit']
+        if 'cursor' in filters.keys(): del filters['cursor']
+        if 'fields' in filters.keys(): del filters['fields']
+        if 'facets' in filters.keys(): del filters['facets']
 
         autocomp_filters = {}
         for fltr, val in filters.items():
@@ -287,30 +913,129 @@ class BaseSearchResource(Resource):
 
             del filters[fltr]
 
-        result = self.get_object_list(request)
+        return sort_expr, autocomp_filters, and_filters, or_filters, not_filters
 
-        if autocomp_filters:
-            for fltr, val in autocomp_filters.items():
-                result = result.autocomplete(**{fltr: val})
+    def obj_get_list(self, request=None, **kwargs):
+        request = kwargs['bundle'].request
+        sort_expr, autocomp_filters, and_filters, or_filters, not_filters = \
+            self.parse_filters(request)
 
-        if and_filters:
-            stem_lang = and_filters.get('lang') or ''
-            applicable_filters = self.build_filters(and_filters, stem_lang)
-            result = self.apply_filters(request, applicable_filters)
+        facets = self.get_requested_facets(request)
 
-        if or_filters:
-            applicable_filters = self.build_filters(or_filters)
-            result = result | self.apply_filters(request, applicable_filters, 'or')
+        prefix_index = self._meta.prefix_index
 
-        if not_filters:
-            applicable_filters = self.build_filters(not_filters)
-            result = result & self.apply_filters(request, applicable_filters, 'not')
+        # Plain typeahead requests are answered from memory once the
+        # prefix index has caught up with the search index.
+        if prefix_index and autocomp_filters.keys() == [prefix_index.field] \
+                and not (and_filters or or_filters or not_filters or sort_expr) \
+                and 'cursor' not in request.GET \
+                and prefix_index.ready(
+                    index_generation(settings.HAYSTACK_CONNECTIONS['default']['PATH'])):
+            return prefix_index.search(autocomp_filters[prefix_index.field])
+
+        result = self.get_object_list(request)
+        query = self.compile_query(
+            result, autocomp_filters, and_filters, or_filters, not_filters)
+
+        note_query(query)
+
+        if query:
+            result = result.filter(query)
+
+            # Unfiltered counts come from facet_cache instead, see
+            # alter_list_data_to_serialize.
+            for field in facets:
+                result = result.facet(field)
 
         if sort_expr:
             result = self.apply_sort(result, sort_expr)
 
         return result
 
+    def get_requested_facets(self, request):
+        value = request.GET.get('facets', '')
+        facets = [field.strip() for field in value.split(',') if field.strip()]
+
+        for field in facets:
+            if field not in self._meta.facet_fields:
+                raise BadRequest("The '%s' field does not allow faceting." % field)
+
+        return facets
+
+    def format_facet_counts(self, counts):
+        """
+        Turns the backend's [(value, count)] lists into {value: count},
+        splitting the values of the fields listed in Meta.facet_separators
+        (fields indexed as one joined string) into their parts.
+        """
+        facets = {}
+
+        for field, values in counts.items():
+            separator = self._meta.facet_separators.get(field)
+            field_counts = {}
+
+            for value, n in values:
+                parts = value.split(separator) if separator else [value]
+                for part in parts:
+                    if part == '':
+                        continue
+                    field_counts[part] = field_counts.get(part, 0) + n
+
+            facets[field] = field_counts
+
+        return facets
+
+    def get_unfiltered_facet_counts(self, request, facets):
+        """
+        Facet counts over the whole index, computed once per field and
+        index generation.
+        """
+        generation = index_generation(settings.HAYSTACK_CONNECTIONS['default']['PATH'])
+        counts = {}
+        missing = []
+
+        for field in facets:
+            cached = facet_cache.get((self._meta.resource_name, field), generation)
+            if cached is None:
+                missing.append(field)
+            else:
+                counts[field] = cached
+
+        if missing:
+            sqs = self.get_object_list(request)
+            for field in missing:
+                sqs = sqs.facet(field)
+            sqs.query.set_limits(0, 1)
+
+            computed = self.format_facet_counts(sqs.query.get_facet_counts().get('fields', {}))
+
+            for field in missing:
+                counts[field] = computed.get(field, {})
+                facet_cache.set((self._meta.resource_name, field), generation, counts[field])
+
+        return counts
+
+    def alter_list_data_to_serialize(self, request, data):
+        facets = self.get_requested_facets(request)
+
+        if facets:
+            counts = data['meta'].get('facets')
+            if counts is None:
+                data['meta']['facets'] = self.get_unfiltered_facet_counts(request, facets)
+            else:
+                data['meta']['facets'] = self.format_facet_counts(counts)
+
+        return data
+
+    def get_multiple_objects(self, base_bundle, ids):
+        if not ids:
+            return {}
+
+        results = self.get_object_list(base_bundle.request)\
+                      .filter(django_id__in=sorted(ids))[:len(ids)]
+
+        return dict((int(result.django_id), result) for result in results)
+
     def obj_get(self, request=None, **kwargs):
         pk_fld = self._meta.detail_uri_name
         pk = kwargs.get(pk_fld)
@@ -0,0 +1,183 @@
+"""
+In-process prefix index answering the autocomplete requests of a search
+resource without going to Xapian. It holds the ids of one model's rows,
+ordered by a popularity column, and a sorted array of the words of their
+names pointing back to them, all read from the database.
+"""
+from django.conf import settings
+from django.db import connection
+from haystack import connections
+from haystack.models import SearchResult
+from .utils import LRUCache, uclean
+from array import array
+from bisect import bisect_left
+from threading import Lock, Thread
+from time import time
+import os
+
+
+# Minimum number of seconds between the starts of two rebuilds, so that a
+# busy index queue doesn't keep every process rebuilding its prefix
+# indexes. Xapian answers in the meantime.
+REFRESH_INTERVAL = getattr(settings, 'API_AUTOCOMPLETE_REFRESH', 60)
+RESULT_CACHE_SIZE = getattr(settings, 'API_AUTOCOMPLETE_CACHE_SIZE', 1000)
+
+
+def prefix_words(text):
+    return (text or u'').lower().split()
+
+
+class PrefixResults(object):
+    """
+    The matches of a prefix search, as a sequence of search results that
+    only prepares the documents of the slices taken from it, the way
+    Xapian would have returned them.
+    """
+
+    def __init__(self, prefix_index, ids):
+        self.prefix_index = prefix_index
+        self.ids = ids
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            return self.prefix_index.results(self.ids[key])
+
+        return self.prefix_index.results(self.ids[key:key + 1 or None])[0]
+
+    def __iter__(self):
+        return iter(self[:])
+
+
+class PrefixIndex(object):
+    """
+    Matches the rows of `model` whose `name_field` has a word starting
+    with each word of the query, like the EdgeNgramField `field` of the
+    search index, and returns them by decreasing `rank_field`.
+
+    The index is built in a background thread of each process the first
+    time it's asked for, rebuilt when the search index generation
+    changes, and only used once it was built for the current generation.
+    """
+
+    def __init__(self, model, field, name_field, rank_field):
+        self.model = model
+        self.field = field
+        self.name_field = name_field
+        self.rank_field = rank_field
+        self.reset()
+
+    def reset(self):
+        self.pid = os.getpid()
+        self.lock = Lock()
+        self.building = False
+        self.started = 0
+        # (generation, sorted words, id position of each word, ids by
+        # rank, result cache), swapped in one assignment on rebuild.
+        self.state = (None, [], array('i'), array('l'), LRUCache(RESULT_CACHE_SIZE))
+
+    def ready(self, generation):
+        """
+        Whether the index was built for `generation`. If it wasn't, a
+        rebuild is started unless one is running or started less than
+        REFRESH_INTERVAL seconds ago.
+        """
+        # A forked process inherits neither the building thread nor a
+        # usable database connection.
+        if self.pid != os.getpid():
+            self.reset()
+
+        if self.state[0] == generation:
+            return True
+
+        with self.lock:
+            if self.building or time() - self.started < REFRESH_INTERVAL:
+                return False
+
+            self.building = True
+            self.started = time()
+
+        thread = Thread(target=self.build, args=(generation,), name='prefix-index')
+        thread.daemon = True
+        thread.start()
+
+        return False
+
+    def build(self, generation):
+        try:
+            rows = list(self.model.objects.values_list(
+                'id', self.name_field, self.rank_field
+                ))
+            rows.sort(key=lambda row: (-(row[2] or 0), uclean(row[1] or u'')))
+
+            pairs = sorted(
+                (word, position)
+                for position, (_, name, _) in enumerate(rows)
+                for word in set(prefix_words(uclean(name or u'')))
+                )
+
+            self.state = (
+                generation,
+                [word for word, position in pairs],
+                array('i', (position for word, position in pairs)),
+                array('l', (row[0] for row in rows)),
+                LRUCache(RESULT_CACHE_SIZE),
+                )
+        finally:
+            self.building = False
+            connection.close()
+
+    def results(self, ids):
+        """
+        The search results of the rows `ids`, in that order, prepared by
+        the model's search index.
+        """
+        index = connections['default'].get_unified_index().get_index(self.model)
+        objects = list(index.index_queryset().filter(id__in=list(ids)))
+        prepare_batch = getattr(index, 'prepare_batch', None)
+
+        if prepare_batch:
+            prepare_batch(objects)
+
+        by_id = dict((obj.pk, obj) for obj in objects)
+        results = []
+
+        for id in ids:
+            # Rows deleted since the build are left out.
+            if id in by_id:
+                obj = by_id[id]
+                results.append(SearchResult(
+                    obj._meta.app_label, obj._meta.model_name, obj.pk, 100,
+                    **index.full_prepare(obj)
+                    ))
+
+        return results
+
+    def search(self, text):
+        _, words, positions, ids, cache = self.state
+        key = tuple(sorted(set(prefix_words(text))))
+
+        matched = cache.get(key)
+        if matched is None:
+            if not key:
+                matched = ids
+            else:
+                matches = None
+
+                for prefix in key:
+                    start = bisect_left(words, prefix)
+                    end = bisect_left(words, prefix + u'\uffff', start)
+                    found = set(positions[start:end])
+                    matches = found if matches is None else matches & found
+
+                    if not matches:
+                        break
+
+                # Positions follow the rank order.
+                matched = array('l', (ids[position] for position in sorted(matches)))
+
+            cache.set(key, matched)
+
+        return PrefixResults(self, matched)
@@ -0,0 +1,157 @@
+from django.conf import settings
+from xapian_backend import (
+    XapianEngine as BaseXapianEngine,
+    XapianSearchBackend as BaseXapianSearchBackend,
+    DEFAULT_CHECK_AT_LEAST, MEMORY_DB_NAME, InvalidIndexError
+    )
+from .generations import (
+    touch, index_generation, new_generation_path, activate, prune, DEFAULT_KEEP
+    )
+from .instrumentation import timed
+from .slow_searches import note_search
+from threading import Lock, current_thread, enumerate as enumerate_threads, local
+from time import time
+import os
+import xapian
+
+
+REUSE_HANDLES = getattr(settings, 'HAYSTACK_XAPIAN_REUSE_HANDLES', True)
+
+
+class ReadHandles(object):
+    """
+    Keeps one read-only xapian.Database open per thread and index path.
+    A handle is reused as long as the index generation is unchanged,
+    reopened to see new revisions after in place writes and replaced
+    when the path points to another generation directory.
+    """
+
+    def __init__(self):
+        self.handles = {}
+        self.lock = Lock()
+        self.opened = 0
+        self.reopened = 0
+        self.reused = 0
+
+    def get(self, path):
+        key = (current_thread().ident, path)
+        generation = index_generation(path)
+        database, seen = self.handles.get(key, (None, None))
+
+        if database is not None and seen == generation:
+            with self.lock:
+                self.reused += 1
+            return database
+
+        if database is not None and seen[0] == generation[0]:
+            database.reopen()
+            with self.lock:
+                self.reopened += 1
+        else:
+            database = xapian.Database(path)
+            with self.lock:
+                self.opened += 1
+                self.prune()
+
+        with self.lock:
+            self.handles[key] = (database, generation)
+
+        return database
+
+    def prune(self):
+        # Drop the handles of finished threads.
+        alive = set(thread.ident for thread in enumerate_threads())
+
+        for key in [key for key in self.handles if key[0] not in alive]:
+            self.handles.pop(key, None)
+
+    def stats(self):
+        return {
+            'open': len(self.handles),
+            'opened': self.opened,
+            'reopened': self.reopened,
+            'reused': self.reused,
+            }
+
+
+read_handles = ReadHandles()
+
+
+class XapianSearchBackend(BaseXapianSearchBackend):
+
+    def __init__(self, connection_alias, **connection_options):
+        super(XapianSearchBackend, self).__init__(connection_alias, **connection_options)
+        # The backend is shared by the threads of the process, the state
+        # of a search is kept per thread.
+        self.searching = local()
+
+    def update(self, index, iterable, commit=True):
+        # Give indexes that know how to preload their related rows a chance
+        # to do it for the whole batch instead of once per object.
+        prepare_batch = getattr(index, 'prepare_batch', None)
+
+        if prepare_batch is not None:
+            iterable = list(iterable)
+            prepare_batch(iterable)
+
+        try:
+            return super(XapianSearchBackend, self).update(index, iterable, commit)
+        finally:
+            if prepare_batch is not None:
+                index.clear_batch()
+            touch(self.path)
+
+    def search(self, query, facets=None, **kwargs):
+        # Facet match spies only see the documents Xapian checks, so make
+        # it check every match for exact counts.
+        self.searching.count_all_matches = bool(facets)
+        started = time()
+
+        try:
+            with timed('xapian'):
+                results = super(XapianSearchBackend, self).search(query, facets=facets, **kwargs)
+        finally:
+            self.searching.count_all_matches = False
+
+        note_search(query, results.get('hits'), time() - started)
+
+        return results
+
+    def _get_enquire_mset(self, database, enquire, start_offset, end_offset,
+                          checkatleast=DEFAULT_CHECK_AT_LEAST):
+        if getattr(self.searching, 'count_all_matches', False):
+            checkatleast = database.get_doccount()
+
+        return BaseXapianSearchBackend._get_enquire_mset(
+            database, enquire, start_offset, end_offset, checkatleast)
+
+    def _database(self, writable=False):
+        if writable or not REUSE_HANDLES or self.path == MEMORY_DB_NAME:
+            return super(XapianSearchBackend, self)._database(writable)
+
+        try:
+            return read_handles.get(self.path)
+        except xapian.DatabaseOpeningError:
+            raise InvalidIndexError('Unable to open index at %s' % self.path)
+
+    def remove(self, obj, commit=True):
+        super(XapianSearchBackend, self).remove(obj, commit)
+        touch(self.path)
+
+    def clear(self, models=(), commit=True):
+        if not models and os.path.islink(self.path):
+            # The base class removes the directory at PATH, which fails on
+            # the symlink to a generation: switch to an empty generation
+            # instead, leaving the previous one to roll back to.
+            generation = new_generation_path(self.path)
+            os.makedirs(generation)
+            activate(self.path, os.path.basename(generation))
+            prune(self.path, DEFAULT_KEEP)
+            return
+
+        super(XapianSearchBackend, self).clear(models, commit)
+        touch(self.path)
+
+
+class XapianEngine(BaseXapianEngine):
+    backend = XapianSearchBackend
@@ -0,0 +1,317 @@
+"""
+Synthetic Tatoeba-shaped dataset and measurements used by the
+generate_benchmark_data and run_benchmarks commands.
+"""
+from bisect import bisect
+from datetime import datetime, timedelta
+from django.db import connection, reset_queries
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from haystack import connections as haystack_connections
+from pytz import UTC as utc
+from time import time
+from .models import (
+    Sentences, SentencesTranslations, Tags, TagsSentences, Users,
+    UsersLanguages, Groups, Wall, SentenceComments, SentencesLists
+    )
+from .utils import queryset_batches, current_rss
+import random
+
+
+DATASET_MODELS = [
+    Groups, Users, UsersLanguages, Sentences, SentencesTranslations, Tags,
+    TagsSentences, SentencesLists, SentenceComments, Wall
+]
+
+LANGS = [
+    'eng', 'epo', 'tur', 'ita', 'rus', 'deu', 'fra', 'por', 'spa', 'hun',
+    'heb', 'ber', 'jpn', 'ukr', 'fin', 'pol', 'nld', 'cmn', 'mkd', 'lit',
+    'dan', 'swe', 'ces', 'ara', 'lat', 'ell', 'kab', 'toki', 'bul', 'ina'
+]
+
+GROUPS = ['admin', 'corpus_maintainer', 'advanced_contributor', 'contributor',
+          'inactive', 'spammer']
+
+BATCH_SIZE = 500
+
+START_DATE = datetime(2007, 1, 1, tzinfo=utc)
+
+
+class Zipf(object):
+    """
+    Picks items with a probability proportional to 1 / rank ** s.
+    """
+
+    def __init__(self, items, s=1.0, rng=random):
+        self.items = list(items)
+        self.rng = rng
+        self.cumulative = []
+        total = 0.0
+        for rank in range(1, len(self.items) + 1):
+            total += 1.0 / rank ** s
+            self.cumulative.append(total)
+        self.total = total
+
+    def pick(self):
+        return self.items[bisect(self.cumulative, self.rng.random() * self.total)]
+
+
+def ensure_tables():
+    existing = connection.introspection.table_names()
+    with connection.schema_editor() as editor:
+        for model in DATASET_MODELS:
+            if model._meta.db_table not in existing:
+                editor.create_model(model)
+
+
+def flush_tables():
+    for model in DATASET_MODELS:
+        model.objects.all().delete()
+
+
+def bulk_create(model, objects):
+    for start in range(0, len(objects), BATCH_SIZE):
+        model.objects.bulk_create(objects[start:start + BATCH_SIZE])
+
+
+def generate_dataset(sentences=100000, seed=42):
+    """
+    Fills the tables with `sentences` sentences and proportional amounts
+    of users, links, tags, lists, comments and wall messages. Languages,
+    vocabulary, contributors and tags follow Zipf distributions like the
+    real corpus does.
+    """
+    rng = random.Random(seed)
+    nb_users = max(10, sentences // 50)
+    nb_tags = max(10, sentences // 200)
+
+    def date():
+        return START_DATE + timedelta(seconds=rng.randint(0, 8 * 365 * 86400))
+
+    def word():
+        return ''.join(rng.choice('abcdefghijklmnopqrstuvwxyz')
+                       for _ in range(rng.randint(1, 9)))
+
+    vocabularies = {}
+    for lang in LANGS:
+        words = sorted(set(word() for _ in range(5000)))
+        rng.shuffle(words)
+        vocabularies[lang] = Zipf(words, rng=rng)
+    langs = Zipf(LANGS, rng=rng)
+    contributors = Zipf(range(1, nb_users + 1), rng=rng)
+    tag_popularity = Zipf(range(1, nb_tags + 1), rng=rng)
+
+    bulk_create(Groups, [
+        Groups(id=n, name=name, created=START_DATE, modified=START_DATE)
+        for n, name in enumerate(GROUPS, 1)
+        ])
+
+    bulk_create(Users, [
+        Users(id=n, username='user%d' % n, password='', email='user%d@example.com' % n,
+              since=date(), last_time_active=rng.randint(1167609600, 1420070400),
+              level=rng.choice([-1, 0, 1]), group_id=rng.choice([2, 3, 4, 4, 4, 5]),
+              send_notifications=rng.randint(0, 1), name='', birthday=None,
+              description=' '.join(word() for _ in range(rng.randint(0, 40))),
+              homepage='', image='', country_id='', settings='{}')
+        for n in range(1, nb_users + 1)
+        ])
+
+    users_languages = []
+    for user_id in range(1, nb_users + 1):
+        for lang in rng.sample(LANGS[:10], rng.randint(1, 3)):
+            users_languages.append(UsersLanguages(
+                of_user_id=user_id, by_user_id=user_id, language_code=lang,
+                level=rng.randint(0, 5), level_approval_status='', details=''))
+    bulk_create(UsersLanguages, users_languages)
+
+    sentence_langs = {}
+    sentence_objects = []
+    for n in range(1, sentences + 1):
+        lang = langs.pick()
+        sentence_langs[n] = lang
+        vocabulary = vocabularies[lang]
+        created = date()
+        sentence_objects.append(Sentences(
+            id=n, lang=lang,
+            text=' '.join(vocabulary.pick() for _ in range(rng.randint(3, 15))),
+            correctness=-1 if rng.random() < 0.02 else 0,
+            user_id=None if rng.random() < 0.1 else contributors.pick(),
+            created=created, modified=created,
+            hasaudio=rng.choice(['shtooka', 'from_users']) if rng.random() < 0.05 else 'no'))
+    bulk_create(Sentences, sentence_objects)
+    del sentence_objects
+
+    links = set()
+    for sentence_id in range(2, sentences + 1):
+        # Most sentences are added as translations of an older one.
+        if rng.random() < 0.8:
+            original_id = rng.randint(1, sentence_id - 1)
+            links.add((sentence_id, original_id))
+            links.add((original_id, sentence_id))
+    bulk_create(SentencesTranslations, [
+        SentencesTranslations(
+            sentence_id=sentence_id, translation_id=translation_id,
+            sentence_lang=sentence_langs[sentence_id],
+            translation_lang=sentence_langs[translation_id], distance=1)
+        for sentence_id, translation_id in sorted(links)
+        ])
+    del links
+
+    bulk_create(Tags, [
+        Tags(id=n, internal_name='tag_%d' % n, name='tag %s %d' % (word(), n),
+             description='', user_id=contributors.pick(), created=date(),
+             nbrofsentences=0)
+        for n in range(1, nb_tags + 1)
+        ])
+
+    tag_links = set()
+    for sentence_id in rng.sample(range(1, sentences + 1), sentences // 5):
+        for _ in range(rng.randint(1, 3)):
+            tag_links.add((sentence_id, tag_popularity.pick()))
+    bulk_create(TagsSentences, [
+        TagsSentences(sentence_id=sentence_id, tag_id=tag_id,
+                      user_id=contributors.pick(), added_time=date())
+        for sentence_id, tag_id in sorted(tag_links)
+        ])
+
+    bulk_create(SentencesLists, [
+        SentencesLists(is_public=rng.randint(0, 1),
+                       name='list %s %s' % (word(), word()),
+                       user_id=contributors.pick(),
+                       numberofsentences=int(rng.paretovariate(1.2)),
+                       created=date(), modified=date())
+        for _ in range(max(10, sentences // 500))
+        ])
+
+    bulk_create(SentenceComments, [
+        SentenceComments(sentence_id=rng.randint(1, sentences), lang='eng',
+                         text=' '.join(word() for _ in range(rng.randint(3, 60))),
+                         user_id=contributors.pick(), created=date(),
+                         modified=date(), hidden=0)
+        for _ in range(sentences // 50)
+        ])
+
+    bulk_create(Wall, [
+        Wall(owner=contributors.pick(), parent_id=None, date=date(),
+             title='', content=' '.join(word() for _ in range(rng.randint(5, 100))),
+             lft=0, rght=0, hidden=0, modified=date())
+        for _ in range(max(10, sentences // 200))
+        ])
+
+
+def percentile(values, pct):
+    if not values:
+        return None
+
+    values = sorted(values)
+    rank = int(round(pct / 100.0 * (len(values) - 1)))
+    return values[rank]
+
+
+def benchmark_indexes(using='default', batch_size=1000):
+    """
+    Rebuilds every registered index on the `using` connection, returning
+    docs/sec, query count and peak RSS per index.
+    """
+    backend = haystack_connections[using].get_backend()
+    unified_index = haystack_connections[using].get_unified_index()
+    results = {}
+
+    for model in unified_index.get_indexed_models():
+        index = unified_index.get_index(model)
+        backend.clear(models=[model])
+        reset_queries()
+        count = 0
+        peak = current_rss()
+
+        with CaptureQueriesContext(connection) as queries:
+            start = time()
+            for batch in queryset_batches(index.index_queryset(using=using), batch_size):
+                backend.update(index, batch)
+                count += len(batch)
+                peak = max(peak, current_rss())
+            elapsed = time() - start
+
+        results[type(index).__name__] = {
+            'docs': count,
+            'seconds': elapsed,
+            'docs_per_sec': count / elapsed if elapsed else None,
+            'queries': len(queries),
+            'peak_rss_kb': peak,
+        }
+
+    return results
+
+
+def endpoint_requests(rng, count):
+    """
+    Builds a realistic mix of requests for the main endpoints, using words
+    and names present in the dataset.
+    """
+    sample = list(
+        Sentences.objects.filter(lang='eng').values_list('id', 'text')[:1000]
+        )
+    words = [text.split()[0] for _, text in sample if text]
+    tag_names = list(Tags.objects.values_list('name', flat=True)[:200])
+    max_id = Sentences.objects.order_by('-id').values_list('id', flat=True)[0]
+
+    def sentences():
+        return '/0.1/sentences/?format=json&limit=100&offset=%d' % rng.randint(1, max_id)
+
+    def sentence():
+        return '/0.1/sentences/%d/?format=json' % rng.choice(sample)[0]
+
+    def sentences_search():
+        return '/0.1/sentences_search/?format=json&sentence_text=%s' % rng.choice(words)
+
+    def sentences_search_eng():
+        return ('/0.1/sentences_search/?format=json&sentence_text_stemmed=%s&lang=eng'
+                % rng.choice(words))
+
+    def tags_search():
+        return ('/0.1/tags_search/?format=json&name_ngram=%s'
+                % rng.choice(tag_names).split()[1][:3])
+
+    endpoints = {
+        'sentences': sentences,
+        'sentence': sentence,
+        'sentences_search': sentences_search,
+        'sentences_search_stemmed': sentences_search_eng,
+        'tags_search': tags_search,
+    }
+
+    return dict(
+        (name, [build() for _ in range(count)]) for name, build in endpoints.items()
+        )
+
+
+def benchmark_endpoints(requests_per_endpoint=200, seed=42):
+    """
+    Times the given requests through the full Django stack and returns
+    latency percentiles per endpoint in milliseconds.
+    """
+    rng = random.Random(seed)
+    client = Client()
+    results = {}
+
+    for name, urls in endpoint_requests(rng, requests_per_endpoint).items():
+        latencies = []
+        errors = 0
+
+        for url in urls:
+            start = time()
+            response = client.get(url)
+            latencies.append((time() - start) * 1000)
+            if response.status_code >= 400:
+                errors += 1
+            reset_queries()
+
+        results[name] = {
+            'requests': len(urls),
+            'errors': errors,
+            'p50_ms': percentile(latencies, 50),
+            'p99_ms': percentile(latencies, 99),
+            'mean_ms': sum(latencies) / len(latencies),
+        }
+
+    return results
@@ -0,0 +1,157 @@
+"""
+Row counts for the paginated ModelResources. Filtered counts are cached
+per table and normalized filter signature for a few minutes. Whole table
+counts are kept without expiry and recounted in a background thread once
+they are older than TABLE_COUNT_TTL, the stale count being served in the
+meantime. The tables are also written by the PHP site and bulk scripts,
+so a count is never adjusted in place, only recomputed.
+"""
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connections
+from django.db.models.lookups import Lookup
+from django.db.models.sql.where import WhereNode
+from hashlib import md5
+from threading import Lock, Thread
+from time import time
+
+
+COUNT_CACHE = getattr(settings, 'API_COUNT_CACHE', 'default')
+COUNT_TTL = getattr(settings, 'API_COUNT_TTL', 300)
+TABLE_COUNT_TTL = getattr(settings, 'API_TABLE_COUNT_TTL', COUNT_TTL)
+
+# Filtered counts whose EXPLAIN estimate is above this many rows are
+# estimated instead of counted (MySQL only).
+EXACT_COUNT_LIMIT = getattr(settings, 'API_EXACT_COUNT_LIMIT', 1000000)
+
+EXACT = 'exact'
+ESTIMATED = 'estimated'
+CACHED = 'cached'
+
+# Tables being recounted by this process.
+refreshing = set()
+refreshing_lock = Lock()
+
+
+def normalize_value(value):
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return tuple(sorted(normalize_value(v) for v in value))
+
+    return value
+
+
+def node_signature(node):
+    if isinstance(node, WhereNode):
+        return (
+            node.connector, node.negated,
+            tuple(sorted(node_signature(child) for child in node.children))
+            )
+
+    target = getattr(getattr(node, 'lhs', None), 'target', None)
+
+    if not isinstance(node, Lookup) or target is None:
+        raise TypeError('No count signature for %r' % node)
+
+    return (target.column, node.lookup_name, normalize_value(node.rhs))
+
+
+def filter_signature(queryset):
+    """
+    Returns a key identifying the rows selected by `queryset`, the same
+    whatever the order its filters were applied in.
+    """
+    return md5(repr(node_signature(queryset.query.where))).hexdigest()
+
+
+def cache_key(model, signature):
+    return 'tatoeba2:count:%s:%s' % (model._meta.db_table, signature)
+
+
+def table_cache_key(model):
+    return 'tatoeba2:table_count:%s' % model._meta.db_table
+
+
+def estimate(queryset):
+    sql, params = queryset.query.sql_with_params()
+
+    cursor = connections[queryset.db].cursor()
+    cursor.execute('EXPLAIN %s' % sql, params)
+
+    return cursor.fetchone()[-2]
+
+
+def refresh_table_count(queryset):
+    key = table_cache_key(queryset.model)
+
+    try:
+        caches[COUNT_CACHE].set(key, (queryset.count(), time()), None)
+    finally:
+        with refreshing_lock:
+            refreshing.discard(key)
+        connections[queryset.db].close()
+
+
+def table_count(queryset):
+    """
+    Returns (count, mode) for the whole table of `queryset`: EXACT when it
+    was counted for this request, CACHED otherwise.
+    """
+    cache = caches[COUNT_CACHE]
+    key = table_cache_key(queryset.model)
+
+    cached = cache.get(key)
+    if cached is None:
+        value = queryset.count()
+        cache.set(key, (value, time()), None)
+        return value, EXACT
+
+    value, counted = cached
+
+    if time() - counted > TABLE_COUNT_TTL:
+        with refreshing_lock:
+            start = key not in refreshing
+            refreshing.add(key)
+
+        if start:
+            thread = Thread(target=refresh_table_count, args=(queryset.all(),),
+                            name='table-count')
+            thread.daemon = True
+            thread.start()
+
+    return value, CACHED
+
+
+def count(queryset):
+    """
+    Returns (count, mode) for `queryset`, mode being one of EXACT,
+    ESTIMATED or CACHED.
+    """
+    queryset = queryset.order_by()
+
+    if not queryset.query.where:
+        return table_count(queryset)
+
+    cache = caches[COUNT_CACHE]
+    key = cache_key(queryset.model, filter_signature(queryset))
+
+    cached = cache.get(key)
+    if cached is not None:
+        value, mode = cached
+        return value, ESTIMATED if mode == ESTIMATED else CACHED
+
+    mode = EXACT
+    value = None
+
+    if connections[queryset.db].vendor == 'mysql':
+        value = estimate(queryset)
+        if value is not None and value > EXACT_COUNT_LIMIT:
+            mode = ESTIMATED
+        else:
+            value = None
+
+    if value is None:
+        value = queryset.count()
+
+    cache.set(key, (value, mode), COUNT_TTL)
+
+    return value, mode
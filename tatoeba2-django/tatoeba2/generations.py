@@ -0,0 +1,150 @@
+"""
+Blue/green layout of the Xapian index: every full build goes to its own
+directory under `<PATH>.generations/` and `PATH` becomes a symlink to the
+active one, so switching and rolling back are a single rename.
+
+Writes made in place are recorded by touching `<PATH>.stamp`, so
+`index_generation` changes whenever the searchable content may have.
+"""
+from datetime import datetime
+from django.conf import settings
+from haystack.utils import get_model_ct
+from xapian_backend import TERM_PREFIXES
+import os
+import shutil
+import xapian
+
+
+# Number of previous generations kept for rollback.
+DEFAULT_KEEP = getattr(settings, 'HAYSTACK_KEEP_GENERATIONS', 2)
+
+
+def generations_dir(path):
+    return path.rstrip(os.sep) + '.generations'
+
+
+def stamp_path(path):
+    return path.rstrip(os.sep) + '.stamp'
+
+
+def touch(path):
+    with open(stamp_path(path), 'a'):
+        os.utime(stamp_path(path), None)
+
+
+def index_generation(path):
+    """
+    Returns a value that changes when `path` is switched to another
+    directory or written to by the search backend.
+    """
+    try:
+        directory = os.stat(path).st_ino
+    except OSError:
+        directory = None
+
+    try:
+        stamp = os.stat(stamp_path(path)).st_mtime
+    except OSError:
+        stamp = None
+
+    return directory, stamp
+
+
+def list_generations(path):
+    """
+    Returns the generation names of `path`, oldest first.
+    """
+    directory = generations_dir(path)
+
+    if not os.path.isdir(directory):
+        return []
+
+    return sorted(
+        name for name in os.listdir(directory)
+        if os.path.isdir(os.path.join(directory, name))
+        )
+
+
+def current_generation(path):
+    """
+    Returns the name of the active generation, or None if `path` isn't
+    managed by generations yet.
+    """
+    if not os.path.islink(path):
+        return None
+
+    return os.path.basename(os.readlink(path).rstrip(os.sep))
+
+
+def new_generation_path(path):
+    """
+    Returns a not yet existing directory for the next generation.
+    """
+    name = datetime.utcnow().strftime('%Y%m%d-%H%M%S')
+    candidate = os.path.join(generations_dir(path), name)
+    n = 1
+
+    while os.path.exists(candidate):
+        candidate = os.path.join(generations_dir(path), '%s.%d' % (name, n))
+        n += 1
+
+    return candidate
+
+
+def activate(path, generation):
+    """
+    Atomically points `path` at `generation`. Readers that open the index
+    afterwards get the new database, those with an open handle keep the
+    previous one until they close it.
+    """
+    directory = generations_dir(path)
+    target = os.path.join(directory, generation)
+
+    if not os.path.isdir(target):
+        raise ValueError('No generation %s in %s' % (generation, directory))
+
+    if os.path.isdir(path) and not os.path.islink(path):
+        # An index built before generations were used becomes the first
+        # generation so it can still be rolled back to.
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        os.rename(path, os.path.join(directory, '00000000-000000'))
+
+    link = path.rstrip(os.sep) + '.tmp-link'
+    if os.path.lexists(link):
+        os.unlink(link)
+
+    os.symlink(os.path.relpath(target, os.path.dirname(os.path.abspath(path))), link)
+    os.rename(link, path)
+    touch(path)
+
+
+def prune(path, keep):
+    """
+    Removes the oldest generations, keeping the active one and the `keep`
+    most recent other ones.
+    """
+    current = current_generation(path)
+    others = [name for name in list_generations(path) if name != current]
+    removed = others[:max(0, len(others) - keep)]
+
+    for name in removed:
+        shutil.rmtree(os.path.join(generations_dir(path), name))
+
+    return removed
+
+
+def document_counts(path, models):
+    """
+    Returns the number of documents of each model in the database at
+    `path`.
+    """
+    database = xapian.Database(path)
+    try:
+        return dict(
+            (model, database.get_termfreq(
+                TERM_PREFIXES['django_ct'] + get_model_ct(model)))
+            for model in models
+            )
+    finally:
+        database.close()
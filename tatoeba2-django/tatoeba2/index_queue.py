@@ -0,0 +1,152 @@
+from django.conf import settings
+from threading import local
+from time import time
+import os
+import sqlite3
+
+
+def default_queue_path():
+    path = settings.HAYSTACK_CONNECTIONS['default']['PATH']
+    return getattr(settings, 'HAYSTACK_QUEUE_PATH', path.rstrip(os.sep) + '.queue')
+
+
+class IndexQueue(object):
+    """
+    Durable FIFO of (model, pk, action) changes waiting to be applied to
+    the search index, stored in a local SQLite file so several web
+    workers can push to it while a single process consumes it.
+
+    Applied changes are removed, except those queued after a hold mark:
+    swap_index holds the queue while it builds a new generation, and
+    replays them on it once it is active.
+    """
+
+    def __init__(self, path=None):
+        self.path = path or default_queue_path()
+        self.local = local()
+
+    @property
+    def connection(self):
+        connection = getattr(self.local, 'connection', None)
+
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute("""
+                CREATE TABLE IF NOT EXISTS `queue` (
+                    `id` INTEGER PRIMARY KEY AUTOINCREMENT,
+                    `model` TEXT NOT NULL,
+                    `pk` INTEGER NOT NULL,
+                    `action` TEXT NOT NULL,
+                    `queued` REAL NOT NULL
+                )
+                """)
+            connection.execute("""
+                CREATE TABLE IF NOT EXISTS `marks` (
+                    `name` TEXT PRIMARY KEY,
+                    `id` INTEGER NOT NULL
+                )
+                """)
+            connection.commit()
+            self.local.connection = connection
+
+        return connection
+
+    def push(self, model, pk, action='update'):
+        self.push_many([(model, pk, action)])
+
+    def push_many(self, changes):
+        now = time()
+        with self.connection as connection:
+            connection.executemany(
+                'INSERT INTO `queue` (`model`, `pk`, `action`, `queued`) VALUES (?, ?, ?, ?)',
+                [(model, pk, action, now) for model, pk, action in changes])
+
+    def mark(self, name, connection=None):
+        row = (connection or self.connection).execute(
+            'SELECT `id` FROM `marks` WHERE `name` = ?', [name]).fetchone()
+
+        return row[0] if row else None
+
+    def set_mark(self, connection, name, id):
+        if id is None:
+            connection.execute('DELETE FROM `marks` WHERE `name` = ?', [name])
+        else:
+            connection.execute(
+                'INSERT OR REPLACE INTO `marks` (`name`, `id`) VALUES (?, ?)', [name, id])
+
+    def peek(self, limit):
+        """
+        Returns the `limit` oldest changes not applied yet as (id, model,
+        pk, action) rows, without removing them.
+        """
+        self.local.replays = self.mark('replays')
+
+        return self.connection.execute(
+            'SELECT `id`, `model`, `pk`, `action` FROM `queue` WHERE `id` > ? '
+            'ORDER BY `id` LIMIT ?',
+            [self.mark('applied') or 0, limit]).fetchall()
+
+    def ack(self, last_id):
+        """
+        Records that every change up to `last_id` has been applied, and
+        removes those that don't need to be replayed.
+        """
+        with self.connection as connection:
+            applied = self.mark('applied', connection) or 0
+
+            # After a replay requested while the batch was applied, the
+            # batch must be applied again.
+            if self.mark('replays', connection) == getattr(self.local, 'replays', None):
+                applied = max(applied, last_id)
+                self.set_mark(connection, 'applied', applied)
+
+            held = self.mark('held', connection)
+            if held is not None:
+                applied = min(applied, held)
+
+            connection.execute('DELETE FROM `queue` WHERE `id` <= ?', [applied])
+
+    def hold(self):
+        """
+        Keeps the changes queued from now on after they are applied, until
+        replay() or release().
+        """
+        with self.connection as connection:
+            last = connection.execute('SELECT MAX(`id`) FROM `queue`').fetchone()[0]
+            self.set_mark(connection, 'held', last or self.mark('applied', connection) or 0)
+
+    def replay(self):
+        """
+        Applies the changes queued since hold() again, and stops keeping
+        them.
+        """
+        with self.connection as connection:
+            held = self.mark('held', connection)
+
+            if held is not None:
+                applied = self.mark('applied', connection) or 0
+                self.set_mark(connection, 'applied', min(applied, held))
+                self.set_mark(connection, 'replays', (self.mark('replays', connection) or 0) + 1)
+                self.set_mark(connection, 'held', None)
+
+    def release(self):
+        with self.connection as connection:
+            self.set_mark(connection, 'held', None)
+
+    def __len__(self):
+        return self.connection.execute(
+            'SELECT COUNT(*) FROM `queue` WHERE `id` > ?',
+            [self.mark('applied') or 0]).fetchone()[0]
+
+def coalesce(rows):
+    """
+    Collapses queued rows to the last action of each (model, pk), grouped
+    by model: {model: {pk: action}}.
+    """
+    changes = {}
+
+    for _, model, pk, action in rows:
+        changes.setdefault(model, {})[pk] = action
+
+    return changes
@@ -0,0 +1,161 @@
+"""
+Per-request timings of the API phases. Code that wants its time
+accounted for wraps itself in `timed(phase)`; this costs next to nothing
+when no request is being instrumented. SQL queries are timed by the
+cursors of every database connection. The durations are kept in
+fixed-size histograms per resource so percentiles stay cheap to update.
+"""
+from contextlib import contextmanager
+from django.db.backends.signals import connection_created
+from django.db.backends.utils import CursorWrapper, CursorDebugWrapper
+from threading import Lock, local
+from time import time
+import math
+
+
+_local = local()
+
+
+def start():
+    _local.timings = {}
+    _local.calls = {}
+
+
+def stop():
+    """
+    Returns the seconds spent and the number of calls per phase since
+    `start`.
+    """
+    timings = getattr(_local, 'timings', None)
+    calls = getattr(_local, 'calls', None)
+    _local.timings = _local.calls = None
+
+    return timings or {}, calls or {}
+
+
+@contextmanager
+def timed(phase):
+    timings = getattr(_local, 'timings', None)
+
+    if timings is None:
+        yield
+        return
+
+    started = time()
+    try:
+        yield
+    finally:
+        timings[phase] = timings.get(phase, 0.0) + time() - started
+        _local.calls[phase] = _local.calls.get(phase, 0) + 1
+
+
+class TimedCursorWrapper(CursorWrapper):
+
+    def execute(self, sql, params=None):
+        with timed('sql'):
+            return super(TimedCursorWrapper, self).execute(sql, params)
+
+    def executemany(self, sql, param_list):
+        with timed('sql'):
+            return super(TimedCursorWrapper, self).executemany(sql, param_list)
+
+
+class TimedCursorDebugWrapper(CursorDebugWrapper):
+
+    def execute(self, sql, params=None):
+        with timed('sql'):
+            return super(TimedCursorDebugWrapper, self).execute(sql, params)
+
+    def executemany(self, sql, param_list):
+        with timed('sql'):
+            return super(TimedCursorDebugWrapper, self).executemany(sql, param_list)
+
+
+def time_cursors(sender, connection, **kwargs):
+    connection.make_cursor = lambda cursor: TimedCursorWrapper(cursor, connection)
+    connection.make_debug_cursor = lambda cursor: TimedCursorDebugWrapper(cursor, connection)
+
+connection_created.connect(time_cursors, dispatch_uid='instrumentation.time_cursors')
+
+
+# Bucket i holds the durations up to SMALLEST * GROWTH ** i milliseconds,
+# so percentiles are within GROWTH of the real value.
+SMALLEST = 0.05
+GROWTH = 1.1
+BUCKETS = int(math.ceil(math.log(600000 / SMALLEST, GROWTH))) + 1
+
+
+class Histogram(object):
+
+    def __init__(self):
+        self.buckets = [0] * BUCKETS
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, ms):
+        if ms <= SMALLEST:
+            bucket = 0
+        else:
+            bucket = min(int(math.ceil(math.log(ms / SMALLEST, GROWTH))), BUCKETS - 1)
+
+        self.buckets[bucket] += 1
+        self.count += 1
+        self.total += ms
+        self.max = max(self.max, ms)
+
+    def percentile(self, pct):
+        if not self.count:
+            return None
+
+        rank = int(math.ceil(pct / 100.0 * self.count))
+        seen = 0
+
+        for bucket, count in enumerate(self.buckets):
+            seen += count
+            if seen >= rank:
+                return min(SMALLEST * GROWTH ** bucket, self.max)
+
+    def summary(self):
+        return {
+            'count': self.count,
+            'mean': self.total / self.count if self.count else None,
+            'max': self.max,
+            'p50': self.percentile(50),
+            'p95': self.percentile(95),
+            'p99': self.percentile(99),
+            }
+
+
+class Recorder(object):
+    """
+    Histograms of the phase durations, in milliseconds, per resource.
+    """
+
+    def __init__(self):
+        self.histograms = {}
+        self.lock = Lock()
+
+    def record(self, resource, timings):
+        with self.lock:
+            for phase, seconds in timings.items():
+                histogram = self.histograms.get((resource, phase))
+                if histogram is None:
+                    histogram = self.histograms[(resource, phase)] = Histogram()
+                histogram.add(seconds * 1000)
+
+    def summary(self):
+        summary = {}
+
+        with self.lock:
+            for (resource, phase), histogram in self.histograms.items():
+                summary.setdefault(resource, {})[phase] = histogram.summary()
+
+        return summary
+
+    def clear(self):
+        with self.lock:
+            self.histograms.clear()
+
+
+recorder = Recorder()
@@ -0,0 +1,212 @@
+"""
+Replays API requests against the WSGI application, in process, or
+against a running server, from a pool of threads, and reports
+throughput, latency percentiles and errors per resource.
+"""
+from Queue import Queue, Empty
+from StringIO import StringIO
+from threading import Thread
+from time import time, sleep
+from urllib import unquote, urlencode
+from .benchmark import endpoint_requests, percentile
+import json
+import random
+import re
+import sys
+import urllib2
+
+
+ACCESS_LOG_RE = re.compile(r'"GET (\S+) HTTP/[\d.]+"')
+RESOURCE_RE = re.compile(r'^/[^/]+/([^/?]+)')
+
+
+def read_request_log(lines, api_prefix='/0.1'):
+    """
+    Returns the URLs of a request log, one request per line: either a
+    path with its query string, a line of an access log in common or
+    combined format (only GETs are kept) or a record of the slow search
+    log.
+    """
+    urls = []
+
+    for line in lines:
+        line = line.strip()
+
+        if not line or line.startswith('#'):
+            continue
+
+        if line.startswith('{'):
+            record = json.loads(line)
+            # urlencode only takes byte strings beyond ASCII.
+            params = dict(
+                (key, [value.encode('utf-8') for value in values])
+                for key, values in record['params'].items()
+                )
+            urls.append('%s/%s/?%s' % (
+                api_prefix, record['resource'], urlencode(params, doseq=True)))
+            continue
+
+        match = ACCESS_LOG_RE.search(line)
+        if match:
+            urls.append(match.group(1))
+        elif line.startswith('/'):
+            urls.append(line.split()[0])
+
+    return urls
+
+
+def synthetic_requests(count, seed=42):
+    """
+    `count` requests of each endpoint of the benchmarks, shuffled.
+    """
+    rng = random.Random(seed)
+    urls = [
+        url for urls in endpoint_requests(rng, count).values() for url in urls
+        ]
+    rng.shuffle(urls)
+
+    return urls
+
+
+def resource_name(url):
+    match = RESOURCE_RE.match(url)
+    return match.group(1) if match else url.split('?')[0]
+
+
+class WSGITarget(object):
+    """
+    Calls the WSGI application of this process directly.
+    """
+
+    def __init__(self, application, host='localhost'):
+        self.application = application
+        self.host = host
+
+    def __call__(self, url):
+        path, _, query = url.partition('?')
+        environ = {
+            'REQUEST_METHOD': 'GET',
+            'PATH_INFO': unquote(path),
+            'QUERY_STRING': query,
+            'SERVER_NAME': self.host,
+            'SERVER_PORT': '80',
+            'SERVER_PROTOCOL': 'HTTP/1.1',
+            'HTTP_HOST': self.host,
+            'REMOTE_ADDR': '127.0.0.1',
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': 'http',
+            'wsgi.input': StringIO(),
+            'wsgi.errors': sys.stderr,
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': False,
+            'wsgi.run_once': False,
+        }
+        status = []
+
+        def start_response(status_line, headers, exc_info=None):
+            status.append(int(status_line.split()[0]))
+
+        body = self.application(environ, start_response)
+        try:
+            for _ in body:
+                pass
+        finally:
+            if hasattr(body, 'close'):
+                body.close()
+
+        return status[0]
+
+
+class HTTPTarget(object):
+    """
+    Sends the requests to a server, e.g. http://127.0.0.1:8000.
+    """
+
+    def __init__(self, base_url, timeout=30):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+
+    def __call__(self, url):
+        try:
+            response = urllib2.urlopen(self.base_url + url, timeout=self.timeout)
+        except urllib2.HTTPError as e:
+            e.read()
+            return e.code
+
+        response.read()
+        return response.getcode()
+
+
+def replay(target, urls, concurrency=4, rate=None):
+    """
+    Sends `urls` to `target` from `concurrency` threads, at most `rate`
+    requests per second overall (as fast as possible when None). Returns
+    the (url, status, seconds) of every request, status being None when
+    the target raised, and the wall time of the run.
+    """
+    jobs = Queue()
+    for job in enumerate(urls):
+        jobs.put(job)
+
+    samples = []
+    started = time()
+
+    def worker():
+        while True:
+            try:
+                i, url = jobs.get_nowait()
+            except Empty:
+                return
+
+            if rate:
+                delay = started + i / float(rate) - time()
+                if delay > 0:
+                    sleep(delay)
+
+            start = time()
+            try:
+                status = target(url)
+            except Exception:
+                status = None
+            samples.append((url, status, time() - start))
+
+    threads = [Thread(target=worker) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    return samples, time() - started
+
+
+def summarize(samples, elapsed):
+    """
+    Throughput, latency percentiles in milliseconds and error rates per
+    resource, and for all requests under `all`. Failed requests (status
+    >= 500 or no response) count as errors, 4xx as client errors.
+    """
+    groups = {'all': []}
+    for url, status, seconds in samples:
+        groups.setdefault(resource_name(url), []).append((status, seconds))
+        groups['all'].append((status, seconds))
+
+    results = {}
+    for name, group in groups.items():
+        latencies = [seconds * 1000 for _, seconds in group]
+        errors = sum(1 for status, _ in group if status is None or status >= 500)
+        client_errors = sum(1 for status, _ in group if status and 400 <= status < 500)
+
+        results[name] = {
+            'requests': len(group),
+            'requests_per_sec': len(group) / elapsed if elapsed else None,
+            'errors': errors,
+            'error_rate': float(errors) / len(group) if group else 0.0,
+            'client_errors': client_errors,
+            'p50_ms': percentile(latencies, 50),
+            'p95_ms': percentile(latencies, 95),
+            'p99_ms': percentile(latencies, 99),
+            'max_ms': max(latencies) if latencies else None,
+            'mean_ms': sum(latencies) / len(latencies) if latencies else None,
+        }
+
+    return results
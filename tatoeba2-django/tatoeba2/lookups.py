@@ -0,0 +1,117 @@
+from django.conf import settings
+from django.db.models.signals import post_save, post_delete
+from .models import Users, Groups
+from .utils import LRUCache
+
+
+LOOKUP_CACHE_SIZE = getattr(settings, 'HAYSTACK_LOOKUP_CACHE_SIZE', 100000)
+
+
+class FieldLookup(object):
+    """
+    Resolves primary keys of `model` to the value of one of its fields,
+    keeping the results in a bounded LRU cache shared by every index.
+    Ids without a matching row resolve to None. They aren't cached, so a
+    row created later is found, but only remembered as absent until
+    clear_absent() is called at the end of a batch.
+    """
+
+    def __init__(self, model, field, size=LOOKUP_CACHE_SIZE):
+        self.model = model
+        self.field = field
+        self.cache = LRUCache(size)
+        self.absent = set()
+
+    def warm(self, ids):
+        """
+        Loads the ids that aren't cached yet, and returns them.
+        """
+        missing = set(
+            pk for pk in ids
+            if pk is not None and pk not in self.cache and pk not in self.absent
+            )
+
+        if not missing:
+            return missing
+
+        found = dict(
+            self.model.objects.filter(id__in=missing)\
+                              .values_list('id', self.field)
+            )
+
+        # Hits are counted when values are read, misses when ids have to
+        # be loaded from the database.
+        self.cache.misses += len(missing)
+
+        for pk, value in found.items():
+            self.cache.set(pk, value)
+
+        self.absent.update(missing - set(found))
+
+        return missing
+
+    def get(self, pk, default=None):
+        if pk is None:
+            return default
+
+        if pk in self.cache:
+            value = self.cache.get(pk)
+        else:
+            self.warm([pk])
+            value = self.cache.data.get(pk)
+
+        return default if value is None else value
+
+    def get_many(self, ids):
+        ids = set(pk for pk in ids if pk is not None)
+        loaded = self.warm(ids)
+
+        values = {}
+        for pk in ids:
+            # The ids just loaded were counted as misses by warm().
+            if pk in loaded or pk in self.absent:
+                value = self.cache.data.get(pk)
+            else:
+                value = self.cache.get(pk)
+            if value is not None:
+                values[pk] = value
+
+        return values
+
+    def invalidate(self, ids):
+        for pk in ids:
+            self.cache.discard(pk)
+            self.absent.discard(pk)
+
+    def clear_absent(self):
+        self.absent.clear()
+
+    def stats(self):
+        return self.cache.stats()
+
+
+usernames = FieldLookup(Users, 'username')
+group_names = FieldLookup(Groups, 'name')
+
+LOOKUPS = {
+    Users: usernames,
+    Groups: group_names,
+}
+
+
+def invalidate_lookup(sender, instance, **kwargs):
+    LOOKUPS[sender].invalidate([instance.pk])
+
+
+# Saves made in this process. Those of other processes reach the index
+# queue worker through the queue.
+for model in LOOKUPS:
+    post_save.connect(invalidate_lookup, sender=model)
+    post_delete.connect(invalidate_lookup, sender=model)
+
+
+def lookup_stats():
+    return {
+        'usernames': usernames.stats(),
+        'group_names': group_names.stats(),
+    }
@@ -0,0 +1,82 @@
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from optparse import make_option
+from time import time
+from tatoeba2.lookups import usernames
+from tatoeba2.search_indexes import SentencesIndex
+
+
+class Command(BaseCommand):
+    help = ("Compares per-object and batched SentencesIndex.prepare "
+            "throughput and checks that both produce the same documents.")
+    option_list = BaseCommand.option_list + (
+        make_option('-l', '--limit', action='store', dest='limit',
+            default=1000, type='int',
+            help='Number of sentences to prepare.'
+        ),
+        make_option('-b', '--batch-size', action='store', dest='batchsize',
+            default=1000, type='int',
+            help='Number of sentences to preload at once in batched mode.'
+        ),
+    )
+
+    def handle(self, *args, **options):
+        limit = options['limit']
+        batch_size = options['batchsize']
+        index = SentencesIndex()
+        objects = list(index.index_queryset().order_by('id')[:limit])
+
+        def unbatched():
+            index.clear_batch()
+            usernames.cache.clear()
+            return [index.full_prepare(obj) for obj in objects]
+
+        def batched():
+            usernames.cache.clear()
+            docs = []
+            for start in range(0, len(objects), batch_size):
+                chunk = objects[start:start + batch_size]
+                index.prepare_batch(chunk)
+                docs.extend(index.full_prepare(obj) for obj in chunk)
+                index.clear_batch()
+            return docs
+
+        before = self.run('per-object', unbatched)
+        after = self.run('batched', batched)
+
+        mismatches = [
+            doc['id'] for doc, other in zip(before, after)
+            if normalize(doc) != normalize(other)
+            ]
+
+        if mismatches:
+            self.stdout.write('%d documents differ, first ids: %s' % (
+                len(mismatches), mismatches[:10]))
+        else:
+            self.stdout.write('all %d documents are identical' % len(before))
+
+    def run(self, label, func):
+        with CaptureQueriesContext(connection) as queries:
+            start = time()
+            docs = func()
+            elapsed = time() - start
+
+        rate = len(docs) / elapsed if elapsed else float('inf')
+        self.stdout.write('%s: %d docs, %d queries, %.3fs, %.1f docs/sec' % (
+            label, len(docs), len(queries), elapsed, rate))
+        self.stdout.write('  username lookups: %(hits)d hits, %(misses)d misses' %
+            usernames.stats())
+
+        return docs
+
+
+def normalize(doc):
+    # Multi-valued fields are joined from sets, so their order is not
+    # meaningful.
+    normalized = {}
+    for key, value in doc.items():
+        if isinstance(value, basestring) and ' | ' in value:
+            value = sorted(value.split(' | '))
+        normalized[key] = value
+    return normalized
@@ -0,0 +1,66 @@
+from django.core.management.base import BaseCommand
+from optparse import make_option
+from time import time
+from tatoeba2.models import Sentences
+from tatoeba2.utils import Stemmer, STEM_CACHE_SIZE, uclean
+
+
+class Command(BaseCommand):
+    help = ("Measures stemming throughput on sentences from the database "
+            "with and without the token cache.")
+    option_list = BaseCommand.option_list + (
+        make_option('-l', '--lang', action='store', dest='lang',
+            default='eng',
+            help='Language of the sentences to stem.'
+        ),
+        make_option('-n', '--limit', action='store', dest='limit',
+            default=50000, type='int',
+            help='Number of sentences to stem.'
+        ),
+        make_option('-c', '--cache-size', action='store', dest='cache_size',
+            default=STEM_CACHE_SIZE, type='int',
+            help='Size of the token cache for the cached runs.'
+        ),
+    )
+
+    def handle(self, *args, **options):
+        lang = options['lang']
+        texts = [
+            uclean(text) for text in
+            Sentences.objects.filter(lang=lang)\
+                             .values_list('text', flat=True)[:options['limit']]
+            ]
+
+        uncached = Stemmer(cache_size=0)
+        cached = Stemmer(cache_size=options['cache_size'])
+        batched = Stemmer(cache_size=options['cache_size'])
+
+        expected = self.run('uncached stem', texts,
+                            lambda: [uncached.stem(text, lang) for text in texts])
+        results = self.run('cached stem', texts,
+                           lambda: [cached.stem(text, lang) for text in texts])
+        self.compare(expected, results)
+        results = self.run('cached stem_many', texts,
+                           lambda: batched.stem_many(texts, lang))
+        self.compare(expected, results)
+
+        for lang, stats in cached.stats().items():
+            self.stdout.write(
+                '%s cache: %d/%d tokens, %.1f%% hit rate' % (
+                    lang, stats['size'], stats['max_size'],
+                    stats['hit_rate'] * 100))
+
+    def run(self, label, texts, func):
+        start = time()
+        results = func()
+        elapsed = time() - start
+
+        rate = len(texts) / elapsed if elapsed else float('inf')
+        self.stdout.write('%s: %d sentences, %.3fs, %.1f sentences/sec' % (
+            label, len(texts), elapsed, rate))
+
+        return results
+
+    def compare(self, expected, results):
+        if results != expected:
+            self.stdout.write('  results differ from the uncached stemmer')
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from tatoeba2.aggregates import (
+    rebuild_translation_aggregates, refresh_translation_aggregates
+    )
+
+
+class Command(BaseCommand):
+    args = '[sentence_id ...]'
+    help = ("Computes the per-sentence translation aggregates read by the "
+            "sentences index, for the whole corpus or the given sentences.")
+
+    def handle(self, *sentence_ids, **options):
+        if connection.vendor != 'mysql':
+            raise CommandError('Translation aggregates require MySQL.')
+
+        if sentence_ids:
+            refresh_translation_aggregates(int(pk) for pk in sentence_ids)
+            self.stdout.write('Refreshed %d sentences' % len(sentence_ids))
+        else:
+            count = rebuild_translation_aggregates()
+            self.stdout.write('Stored aggregates of %d sentences' % count)
@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand, CommandError
+from optparse import make_option
+from tatoeba2.benchmark import ensure_tables, flush_tables, generate_dataset
+from tatoeba2.models import Sentences
+
+
+class Command(BaseCommand):
+    help = ("Fills the configured database with a synthetic Tatoeba-shaped "
+            "dataset for run_benchmarks. Meant for a local SQLite or MySQL "
+            "database, see tatoeba2-django.benchmark_settings.")
+    option_list = BaseCommand.option_list + (
+        make_option('-n', '--sentences', action='store', dest='sentences',
+            default=100000, type='int',
+            help='Number of sentences; the other tables are sized after it.'
+        ),
+        make_option('--seed', action='store', dest='seed',
+            default=42, type='int',
+            help='Random seed, the same seed always gives the same dataset.'
+        ),
+        make_option('--flush', action='store_true', dest='flush',
+            default=False,
+            help='Delete the existing rows of the dataset tables first.'
+        ),
+    )
+
+    def handle(self, *args, **options):
+        ensure_tables()
+
+        if Sentences.objects.exists():
+            if not options['flush']:
+                raise CommandError('The sentences table is not empty, use --flush '
+                                   'to replace its content.')
+            flush_tables()
+
+        generate_dataset(options['sentences'], options['seed'])
+        self.stdout.write('Generated %d sentences' % options['sentences'])
@@ -0,0 +1,99 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.core.servers.basehttp import get_internal_wsgi_application
+from optparse import make_option
+from tatoeba2.loadtest import (
+    read_request_log, synthetic_requests, WSGITarget, HTTPTarget, replay,
+    summarize
+    )
+from datetime import datetime
+import json
+import sys
+
+
+class Command(BaseCommand):
+    help = ("Replays a request log, or a synthetic mix of requests, against "
+            "the API and reports throughput, latency percentiles and errors "
+            "per resource as JSON.")
+    option_list = BaseCommand.option_list + (
+        make_option('-l', '--log', action='store', dest='log',
+            default=None,
+            help='Request log to replay (paths, access log or slow search '
+                 'log lines), - for stdin.'
+        ),
+        make_option('-s', '--synthetic', action='store', dest='synthetic',
+            default=200, type='int',
+            help='Without --log, number of generated requests per endpoint.'
+        ),
+        make_option('-n', '--requests', action='store', dest='requests',
+            default=None, type='int',
+            help='Total number of requests, cycling through the log.'
+        ),
+        make_option('-c', '--concurrency', action='store', dest='concurrency',
+            default=4, type='int',
+            help='Number of requests in flight.'
+        ),
+        make_option('--rate', action='store', dest='rate',
+            default=None, type='float',
+            help='Requests per second over all threads (as fast as possible '
+                 'by default).'
+        ),
+        make_option('--url', action='store', dest='url',
+            default=None,
+            help='Base URL of a running server, e.g. http://127.0.0.1:8000. '
+                 'The WSGI application is called in process by default.'
+        ),
+        make_option('--host', action='store', dest='host',
+            default='localhost',
+            help='Host header of in process requests.'
+        ),
+        make_option('--seed', action='store', dest='seed',
+            default=42, type='int',
+            help='Seed of the synthetic requests.'
+        ),
+        make_option('-o', '--output', action='store', dest='output',
+            default=None,
+            help='Write the results to this file instead of stdout.'
+        ),
+    )
+
+    def handle(self, *args, **options):
+        if options['log'] == '-':
+            urls = read_request_log(sys.stdin)
+        elif options['log']:
+            with open(options['log']) as f:
+                urls = read_request_log(f)
+        else:
+            urls = synthetic_requests(options['synthetic'], options['seed'])
+
+        if not urls:
+            raise CommandError('No request to replay.')
+
+        if options['requests']:
+            urls = [urls[i % len(urls)] for i in range(options['requests'])]
+
+        if options['url']:
+            target = HTTPTarget(options['url'])
+        else:
+            target = WSGITarget(get_internal_wsgi_application(), options['host'])
+
+        samples, elapsed = replay(target, urls, options['concurrency'], options['rate'])
+
+        results = {
+            'meta': {
+                'date': datetime.utcnow().isoformat(),
+                'target': options['url'] or 'wsgi',
+                'requests': len(urls),
+                'concurrency': options['concurrency'],
+                'rate': options['rate'],
+                'seconds': elapsed,
+            },
+            'resources': summarize(samples, elapsed),
+        }
+
+        output = json.dumps(results, indent=2, sort_keys=True)
+
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(output + '\n')
+        else:
+            self.stdout.write(output)
@@ -0,0 +1,206 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, reset_queries
+from django.db.models import Min, Max
+from haystack import connections as haystack_connections
+from haystack.exceptions import NotHandled
+from haystack.utils import get_model_ct
+from haystack.utils.app_loading import haystack_get_models, haystack_get_model
+from multiprocessing import Pool, cpu_count
+from optparse import make_option
+from tatoeba2.backends import XapianSearchBackend
+from tatoeba2.generations import touch
+from tatoeba2.utils import queryset_batches
+from xapian_backend import TERM_PREFIXES
+import os
+import shutil
+import tempfile
+import xapian
+
+
+DEFAULT_BATCH_SIZE = 1000
+
+
+def shard_backend(using, path):
+    options = dict(settings.HAYSTACK_CONNECTIONS[using])
+    options['PATH'] = path
+    return XapianSearchBackend(using, **options)
+
+
+def pk_ranges(qs, count):
+    """
+    Splits the primary key span of `qs` into at most `count` half-open
+    [start, end) ranges.
+    """
+    bounds = qs.aggregate(Min('pk'), Max('pk'))
+    low, high = bounds['pk__min'], bounds['pk__max']
+
+    if low is None:
+        return []
+
+    high += 1
+    step = max(1, -(-(high - low) // count))
+
+    return [(start, min(start + step, high)) for start in range(low, high, step)]
+
+
+def build_shard(task):
+    using, app_label, model_name, start, end, path, batch_size = task
+
+    model = haystack_get_model(app_label, model_name)
+    index = haystack_connections[using].get_unified_index().get_index(model)
+    backend = shard_backend(using, path)
+    qs = index.build_queryset(using=using).filter(pk__gte=start, pk__lt=end)
+
+    count = 0
+    for batch in queryset_batches(qs, batch_size):
+        backend.update(index, batch)
+        count += len(batch)
+        reset_queries()
+
+    return path, count
+
+
+def compact(sources, destination):
+    compactor = xapian.Compactor()
+    compactor.set_destdir(destination)
+    for source in sources:
+        compactor.add_source(source)
+    compactor.compact()
+
+
+def replace_directory(source, destination):
+    previous = None
+
+    if os.path.exists(destination):
+        previous = destination + '.old'
+        if os.path.exists(previous):
+            shutil.rmtree(previous)
+        os.rename(destination, previous)
+
+    os.rename(source, destination)
+
+    if previous:
+        shutil.rmtree(previous)
+
+
+class Command(BaseCommand):
+    args = '<app_label or app_label.model_name ...>'
+    help = ("Rebuilds the Xapian index by preparing primary key shards "
+            "in a process pool and merging them into the index path.")
+    option_list = BaseCommand.option_list + (
+        make_option('-k', '--workers', action='store', dest='workers',
+            default=cpu_count(), type='int',
+            help='Number of worker processes (defaults to the number of cores).'
+        ),
+        make_option('-n', '--shards', action='store', dest='shards',
+            default=0, type='int',
+            help='Number of primary key ranges per model (defaults to 4 per worker).'
+        ),
+        make_option('-b', '--batch-size', action='store', dest='batchsize',
+            default=DEFAULT_BATCH_SIZE, type='int',
+            help='Number of objects prepared and written at once by each worker.'
+        ),
+        make_option('-u', '--using', action='store', dest='using',
+            default='default',
+            help='The haystack connection to rebuild.'
+        ),
+        make_option('-p', '--path', action='store', dest='path',
+            default=None,
+            help='Write the merged index to this directory instead of the '
+                 'connection PATH.'
+        ),
+    )
+
+    def handle(self, *labels, **options):
+        self.verbosity = int(options.get('verbosity', 1))
+        using = options['using']
+        workers = max(1, options['workers'])
+        shards = options['shards'] or workers * 4
+        batch_size = options['batchsize']
+        path = settings.HAYSTACK_CONNECTIONS[using]['PATH']
+        target = options['path'] or path
+        unified_index = haystack_connections[using].get_unified_index()
+
+        models = []
+        for label in labels or ['tatoeba2']:
+            for model in haystack_get_models(label):
+                try:
+                    unified_index.get_index(model)
+                except NotHandled:
+                    continue
+                models.append(model)
+
+        if os.path.islink(target):
+            raise CommandError(
+                '%s points to an index generation, use swap_index to rebuild it.'
+                % target)
+
+        workdir = tempfile.mkdtemp(
+            prefix='.rebuild-', dir=os.path.dirname(os.path.abspath(target)))
+
+        try:
+            tasks = []
+            for model in models:
+                index = unified_index.get_index(model)
+                qs = index.build_queryset(using=using)
+                ranges = pk_ranges(qs, shards)
+
+                if self.verbosity >= 1:
+                    self.stdout.write('Indexing %s in %d shards' % (
+                        model._meta.db_table, len(ranges)))
+
+                for n, (start, end) in enumerate(ranges):
+                    shard_path = os.path.join(
+                        workdir, '%s-%d' % (get_model_ct(model), n))
+                    tasks.append((
+                        using, model._meta.app_label, model._meta.model_name,
+                        start, end, shard_path, batch_size
+                        ))
+
+            # Children must open their own database connections instead of
+            # sharing the parent's socket.
+            connections.close_all()
+
+            pool = Pool(workers)
+            try:
+                results = pool.map(build_shard, tasks, chunksize=1)
+            finally:
+                pool.close()
+                pool.join()
+
+            sources = [shard for shard, count in results if count]
+
+            if labels and os.path.exists(path):
+                sources.append(self.keep_other_models(path, workdir, models))
+
+            if self.verbosity >= 1:
+                self.stdout.write('Merging %d shards (%d documents)' % (
+                    len(sources), sum(count for _, count in results)))
+
+            merged = os.path.join(workdir, 'merged')
+            compact(sources, merged)
+            replace_directory(merged, target)
+
+            if target == path:
+                touch(path)
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    def keep_other_models(self, path, workdir, models):
+        """
+        Copies the current index without the documents of the rebuilt
+        models, so a partial rebuild doesn't drop the other models.
+        """
+        kept = os.path.join(workdir, 'kept')
+        compact([path], kept)
+
+        database = xapian.WritableDatabase(kept, xapian.DB_OPEN)
+        try:
+            for model in models:
+                database.delete_document(
+                    TERM_PREFIXES['django_ct'] + get_model_ct(model))
+        finally:
+            database.close()
+
+        return kept
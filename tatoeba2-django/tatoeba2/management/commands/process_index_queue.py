@@ -0,0 +1,108 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import reset_queries
+from haystack import connections as haystack_connections
+from haystack.exceptions import NotHandled
+from haystack.utils.app_loading import haystack_get_model
+from optparse import make_option
+from time import sleep
+from tatoeba2.aggregates import refresh_translation_aggregates
+from tatoeba2.index_queue import IndexQueue, coalesce
+from tatoeba2.lookups import LOOKUPS
+from tatoeba2.models import Sentences
+from tatoeba2.search_indexes import TRANSLATION_AGGREGATES
+import fcntl
+
+
+DEFAULT_INTERVAL = getattr(settings, 'HAYSTACK_QUEUE_INTERVAL', 2.0)
+DEFAULT_BATCH_SIZE = getattr(settings, 'HAYSTACK_QUEUE_BATCH_SIZE', 1000)
+
+
+class Command(BaseCommand):
+    help = ("Applies the changes recorded by QueuedSignalProcessor to the "
+            "search index, merging repeated changes to the same object.")
+    option_list = BaseCommand.option_list + (
+        make_option('-i', '--interval', action='store', dest='interval',
+            default=DEFAULT_INTERVAL, type='float',
+            help='Seconds to wait when the queue holds less than a batch.'
+        ),
+        make_option('-b', '--batch-size', action='store', dest='batchsize',
+            default=DEFAULT_BATCH_SIZE, type='int',
+            help='Maximum number of queued changes applied at once.'
+        ),
+        make_option('--once', action='store_true', dest='once',
+            default=False,
+            help='Drain the queue and exit instead of running forever.'
+        ),
+        make_option('-u', '--using', action='store', dest='using',
+            default='default',
+            help='The haystack connection to update.'
+        ),
+    )
+
+    def handle(self, *args, **options):
+        self.verbosity = int(options.get('verbosity', 1))
+        self.using = options['using']
+        interval = options['interval']
+        batch_size = options['batchsize']
+        queue = IndexQueue()
+
+        # Xapian allows a single writer, keep other workers out.
+        lock = open(queue.path + '.lock', 'w')
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except IOError:
+            raise CommandError('Another process_index_queue is running.')
+
+        try:
+            while True:
+                rows = queue.peek(batch_size)
+
+                if rows:
+                    self.apply(coalesce(rows))
+                    queue.ack(rows[-1][0])
+                    reset_queries()
+
+                    if self.verbosity >= 2:
+                        self.stdout.write('Applied %d queued changes' % len(rows))
+
+                if len(rows) < batch_size:
+                    if options['once']:
+                        break
+                    sleep(interval)
+        finally:
+            lock.close()
+
+    def apply(self, changes):
+        backend = haystack_connections[self.using].get_backend()
+        unified_index = haystack_connections[self.using].get_unified_index()
+
+        for label, actions in changes.items():
+            model = haystack_get_model(*label.split('.'))
+
+            if model in LOOKUPS:
+                LOOKUPS[model].invalidate(actions.keys())
+
+            try:
+                index = unified_index.get_index(model)
+            except NotHandled:
+                continue
+
+            # The trans_* fields are read from the aggregates table, which
+            # must reflect the queued link and translation changes first.
+            if model is Sentences and TRANSLATION_AGGREGATES:
+                refresh_translation_aggregates(actions.keys())
+
+            updated = [pk for pk, action in actions.items() if action == 'update']
+            objects = list(
+                index.index_queryset(using=self.using).filter(pk__in=updated))
+
+            if objects:
+                backend.update(index, objects)
+
+            # Deleted objects, and updated ones that index_queryset no
+            # longer returns, must leave the index.
+            found = set(obj.pk for obj in objects)
+            for pk in actions:
+                if pk not in found:
+                    backend.remove('%s.%s' % (label, pk))
@@ -0,0 +1,53 @@
+from django.core.management.base import BaseCommand
+from optparse import make_option
+from tatoeba2.benchmark import benchmark_indexes, benchmark_endpoints
+from tatoeba2.models import Sentences
+from datetime import datetime
+import json
+import platform
+
+
+class Command(BaseCommand):
+    help = ("Indexes the dataset with every SearchIndex and times the main "
+            "API endpoints, printing the results as JSON.")
+    option_list = BaseCommand.option_list + (
+        make_option('-b', '--batch-size', action='store', dest='batchsize',
+            default=1000, type='int',
+            help='Number of objects indexed at once.'
+        ),
+        make_option('-r', '--requests', action='store', dest='requests',
+            default=200, type='int',
+            help='Number of requests per endpoint.'
+        ),
+        make_option('--skip-indexing', action='store_false', dest='indexing',
+            default=True,
+            help='Only time the endpoints against the current index.'
+        ),
+        make_option('-o', '--output', action='store', dest='output',
+            default=None,
+            help='Write the results to this file instead of stdout.'
+        ),
+    )
+
+    def handle(self, *args, **options):
+        results = {
+            'meta': {
+                'date': datetime.utcnow().isoformat(),
+                'python': platform.python_version(),
+                'sentences': Sentences.objects.count(),
+                'batch_size': options['batchsize'],
+            },
+        }
+
+        if options['indexing']:
+            results['indexes'] = benchmark_indexes(batch_size=options['batchsize'])
+
+        results['endpoints'] = benchmark_endpoints(options['requests'])
+
+        output = json.dumps(results, indent=2, sort_keys=True)
+
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(output + '\n')
+        else:
+            self.stdout.write(output)
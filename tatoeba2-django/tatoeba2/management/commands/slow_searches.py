@@ -0,0 +1,91 @@
+from django.core.management.base import BaseCommand, CommandError
+from optparse import make_option
+from tatoeba2.benchmark import percentile
+from tatoeba2.slow_searches import default_log_path, query_shape
+import json
+import os
+
+
+ORDERS = ('total', 'count', 'max', 'p95')
+
+
+class Command(BaseCommand):
+    help = ("Groups the slow search log by resource and query shape (the "
+            "filters and operators, without their values) and prints the "
+            "shapes that cost the most.")
+    option_list = BaseCommand.option_list + (
+        make_option('--log', action='store', dest='log',
+            default=None,
+            help='Slow search log to read, rotated files included.'
+        ),
+        make_option('-n', '--top', action='store', dest='top',
+            default=20, type='int',
+            help='Number of query shapes printed.'
+        ),
+        make_option('-r', '--resource', action='store', dest='resource',
+            default=None,
+            help='Only count the requests of this resource.'
+        ),
+        make_option('-o', '--order-by', action='store', dest='order',
+            default='total', type='choice', choices=ORDERS,
+            help='Rank the shapes by total time, count, max or p95 time.'
+        ),
+    )
+
+    def handle(self, *args, **options):
+        self.verbosity = int(options.get('verbosity', 1))
+        path = options['log'] or default_log_path()
+        paths = [path] + ['%s.%d' % (path, i) for i in range(1, 100)]
+        paths = [p for p in paths if os.path.exists(p)]
+
+        if not paths:
+            raise CommandError('No slow search log at %s.' % path)
+
+        groups = {}
+
+        for record in self.records(paths):
+            if options['resource'] and record['resource'] != options['resource']:
+                continue
+
+            shape = query_shape(record['query']) if record.get('query') else '()'
+            group = groups.setdefault((record['resource'], shape), {
+                'times': [], 'example': record,
+                })
+            group['times'].append(record['elapsed_ms'])
+
+        rows = []
+        for (resource, shape), group in groups.items():
+            times = group['times']
+            rows.append({
+                'resource': resource,
+                'shape': shape,
+                'count': len(times),
+                'total': sum(times),
+                'max': max(times),
+                'p95': percentile(times, 95),
+                'example': group['example'],
+                })
+
+        rows.sort(key=lambda row: row[options['order']], reverse=True)
+
+        for row in rows[:options['top']]:
+            self.stdout.write('%6d requests  %10.0f ms total  %8.0f ms p95  %8.0f ms max  %s %s' % (
+                row['count'], row['total'], row['p95'], row['max'],
+                row['resource'], row['shape']))
+
+            if self.verbosity >= 2:
+                example = row['example']
+                self.stdout.write('    params: %s' % json.dumps(example['params'], sort_keys=True))
+                for search in example['searches']:
+                    self.stdout.write('    %s (%s hits, %.1f ms)' % (
+                        search['xapian'], search['hits'], search['ms']))
+
+    def records(self, paths):
+        for path in paths:
+            with open(path) as f:
+                for line in f:
+                    try:
+                        yield json.loads(line)
+                    except ValueError:
+                        # Partly written line.
+                        continue
@@ -0,0 +1,167 @@
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from haystack import connections as haystack_connections
+from multiprocessing import cpu_count
+from optparse import make_option
+from tatoeba2.generations import (
+    list_generations, current_generation, new_generation_path, activate,
+    prune, document_counts, DEFAULT_KEEP
+    )
+from tatoeba2.index_queue import IndexQueue
+from tatoeba2.management.commands.update_index_from_contributions import (
+    default_mark_path, tag_links_path
+    )
+import os
+import shutil
+
+
+class Command(BaseCommand):
+    help = ("Builds the index into a new generation directory, checks its "
+            "document counts against the tables and switches PATH to it. "
+            "Changes made by process_index_queue and "
+            "update_index_from_contributions during the build are applied "
+            "again to the new generation.")
+    option_list = BaseCommand.option_list + (
+        make_option('-k', '--workers', action='store', dest='workers',
+            default=cpu_count(), type='int',
+            help='Number of worker processes used for the build.'
+        ),
+        make_option('-b', '--batch-size', action='store', dest='batchsize',
+            default=1000, type='int',
+            help='Number of objects prepared and written at once by each worker.'
+        ),
+        make_option('--keep', action='store', dest='keep',
+            default=DEFAULT_KEEP, type='int',
+            help='Number of previous generations kept for rollback.'
+        ),
+        make_option('--tolerance', action='store', dest='tolerance',
+            default=0.001, type='float',
+            help='Accepted relative difference between indexed documents and '
+                 'table rows, for rows written during the build.'
+        ),
+        make_option('--list', action='store_true', dest='list',
+            default=False,
+            help='List the generations and exit.'
+        ),
+        make_option('--activate', action='store', dest='activate',
+            default=None,
+            help='Switch to an existing generation instead of building one.'
+        ),
+        make_option('--rollback', action='store_true', dest='rollback',
+            default=False,
+            help='Switch back to the generation before the active one.'
+        ),
+        make_option('-u', '--using', action='store', dest='using',
+            default='default',
+            help='The haystack connection to rebuild.'
+        ),
+    )
+
+    def handle(self, *args, **options):
+        self.verbosity = int(options.get('verbosity', 1))
+        using = options['using']
+        path = settings.HAYSTACK_CONNECTIONS[using]['PATH']
+        current = current_generation(path)
+
+        if options['list']:
+            for name in list_generations(path):
+                self.stdout.write('%s %s' % ('*' if name == current else ' ', name))
+            return
+
+        if options['rollback']:
+            previous = [name for name in list_generations(path) if name < current]
+            if not previous:
+                raise CommandError('No generation older than %s.' % current)
+            options['activate'] = previous[-1]
+
+        if options['activate']:
+            self.switch(path, options['activate'])
+            return
+
+        build_path = new_generation_path(path)
+
+        # The incremental updaters keep writing to the active generation
+        # during the build. Their changes from its start on are applied
+        # again once the new one is active: the queue keeps them, and the
+        # contributions log position is put back where it was.
+        queue = IndexQueue()
+        queued = os.path.exists(queue.path)
+        if queued:
+            queue.hold()
+        marks = self.read_marks(using)
+
+        try:
+            call_command('parallel_rebuild_index', path=build_path, using=using,
+                         workers=options['workers'], batchsize=options['batchsize'],
+                         verbosity=self.verbosity)
+
+            errors = self.validate(using, build_path, options['tolerance'])
+            if errors:
+                shutil.rmtree(build_path, ignore_errors=True)
+                raise CommandError('Not switching to the new index:\n' + '\n'.join(errors))
+
+            self.switch(path, os.path.basename(build_path))
+
+            if queued:
+                queue.replay()
+            self.restore_marks(marks)
+        finally:
+            if queued:
+                queue.release()
+
+        for name in prune(path, options['keep']):
+            if self.verbosity >= 1:
+                self.stdout.write('Removed generation %s' % name)
+
+    def validate(self, using, path, tolerance):
+        unified_index = haystack_connections[using].get_unified_index()
+        models = unified_index.get_indexed_models()
+        errors = []
+
+        for model, indexed in document_counts(path, models).items():
+            expected = unified_index.get_index(model).index_queryset(using=using).count()
+
+            if self.verbosity >= 1:
+                self.stdout.write('%s: %d documents for %d rows' % (
+                    model._meta.db_table, indexed, expected))
+
+            if abs(indexed - expected) > expected * tolerance:
+                errors.append('%s has %d documents for %d rows' % (
+                    model._meta.db_table, indexed, expected))
+
+        return errors
+
+    def read_marks(self, using):
+        """
+        The contents of the update_index_from_contributions mark files.
+        """
+        mark_path = default_mark_path(using)
+        marks = {}
+
+        for mark_file in (mark_path, tag_links_path(mark_path)):
+            if os.path.exists(mark_file):
+                with open(mark_file) as f:
+                    marks[mark_file] = f.read()
+
+        return marks
+
+    def restore_marks(self, marks):
+        for mark_file, content in marks.items():
+            tmp_path = mark_file + '.tmp'
+            with open(tmp_path, 'w') as f:
+                f.write(content)
+            os.rename(tmp_path, mark_file)
+
+        if marks and self.verbosity >= 1:
+            self.stdout.write('Contributions made during the build will be reindexed '
+                              'by the next update_index_from_contributions')
+
+    def switch(self, path, generation):
+        try:
+            activate(path, generation)
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        if self.verbosity >= 1:
+            self.stdout.write('%s now points to generation %s' % (path, generation))
@@ -0,0 +1,65 @@
+from django.db import reset_queries
+from haystack import connections as haystack_connections
+from haystack.exceptions import NotHandled
+from haystack.management.commands import update_index
+from haystack.utils.app_loading import haystack_get_models
+from optparse import make_option
+from tatoeba2.utils import queryset_batches, current_rss
+
+
+class Command(update_index.Command):
+    option_list = update_index.Command.option_list + (
+        make_option('--stream', action='store_true', dest='stream',
+            default=False,
+            help='Read each model in primary key ordered batches instead of '
+                 'offset slices, keeping memory flat. Ignores --workers and '
+                 '--remove.'
+        ),
+    )
+
+    def handle(self, *items, **options):
+        self.stream = options.get('stream', False)
+        self.peak_rss = []
+
+        result = super(Command, self).handle(*items, **options)
+
+        if self.stream and self.verbosity >= 1:
+            for model, peak in self.peak_rss:
+                self.stdout.write('Peak RSS for %s: %.1f MB' % (
+                    model._meta.db_table, peak / 1024.0))
+
+        return result
+
+    def update_backend(self, label, using):
+        if not self.stream:
+            return super(Command, self).update_backend(label, using)
+
+        backend = haystack_connections[using].get_backend()
+        unified_index = haystack_connections[using].get_unified_index()
+
+        for model in haystack_get_models(label):
+            try:
+                index = unified_index.get_index(model)
+            except NotHandled:
+                continue
+
+            qs = index.build_queryset(using=using, start_date=self.start_date,
+                                      end_date=self.end_date)
+            batch_size = self.batchsize or backend.batch_size
+            peak = current_rss()
+            count = 0
+
+            if self.verbosity >= 1:
+                self.stdout.write('Streaming %s' % model._meta.db_table)
+
+            for batch in queryset_batches(qs, batch_size):
+                backend.update(index, batch, commit=self.commit)
+                count += len(batch)
+                reset_queries()
+                peak = max(peak, current_rss())
+
+                if self.verbosity >= 2:
+                    self.stdout.write('  indexed %d, up to pk %s.' % (
+                        count, batch[-1].pk))
+
+            self.peak_rss.append((model, peak))
@@ -0,0 +1,270 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db.models import Max
+from haystack import connections as haystack_connections
+from optparse import make_option
+from tatoeba2.models import (
+    Sentences, SentencesTranslations, TagsSentences, Contributions,
+    LastContributions
+    )
+from tatoeba2.aggregates import refresh_translation_aggregates
+from tatoeba2.search_indexes import TRANSLATION_AGGREGATES
+from django.utils.dateparse import parse_datetime
+from array import array
+import json
+import os
+
+
+DEFAULT_BATCH_SIZE = 1000
+
+LOG_TABLES = {
+    'contributions': Contributions,
+    'last_contributions': LastContributions,
+}
+
+
+def default_mark_path(using):
+    path = settings.HAYSTACK_CONNECTIONS[using]['PATH']
+    return getattr(
+        settings, 'HAYSTACK_CONTRIBUTIONS_MARK', path.rstrip(os.sep) + '.mark')
+
+
+def tag_links_path(mark_path):
+    return mark_path + '.tag_links'
+
+
+def read_mark(path):
+    if not os.path.exists(path):
+        return {}
+
+    with open(path) as f:
+        return json.load(f)
+
+
+def write_mark(path, mark):
+    tmp_path = path + '.tmp'
+
+    with open(tmp_path, 'w') as f:
+        json.dump(mark, f)
+
+    os.rename(tmp_path, path)
+
+
+def read_tag_links(path):
+    """
+    Returns the (id, sentence_id) pairs of the tag links seen by the last
+    run, flattened and ordered by id, or None before the first one.
+    """
+    if not os.path.exists(path):
+        return None
+
+    links = array('i')
+    with open(path, 'rb') as f:
+        links.fromfile(f, os.path.getsize(path) // links.itemsize)
+
+    return links
+
+
+def write_tag_links(path, links):
+    tmp_path = path + '.tmp'
+
+    with open(tmp_path, 'wb') as f:
+        links.tofile(f)
+
+    os.rename(tmp_path, path)
+
+
+def tag_link_rows(queryset, batch_size=10000):
+    """
+    Yields the (id, sentence_id) pairs of `queryset` in id order, one
+    keyset query per batch.
+    """
+    last_id = 0
+
+    while True:
+        rows = list(
+            queryset.filter(id__gt=last_id).order_by('id')\
+                    .values_list('id', 'sentence_id')[:batch_size]
+            )
+
+        if not rows:
+            return
+
+        for row in rows:
+            yield row
+
+        last_id = rows[-1][0]
+
+
+def tag_links(queryset):
+    return array('i', (value for row in tag_link_rows(queryset) for value in row))
+
+
+def removed_tag_links(links, high):
+    """
+    Returns the sentence ids of the links of `links` that were deleted,
+    checking the table only when it holds fewer links up to `high` than
+    `links` does. Links carry no deletion log, hence the snapshot.
+    """
+    if TagsSentences.objects.filter(id__lte=high).count() >= len(links) // 2:
+        return set()
+
+    remaining = set(
+        link_id for link_id, _ in tag_link_rows(TagsSentences.objects.filter(id__lte=high)))
+
+    return set(
+        links[i + 1] for i in range(0, len(links), 2)
+        if links[i] not in remaining
+        )
+
+
+def affected_sentences(log, changed):
+    """
+    Returns the ids of every sentence whose document depends on the
+    given log entries and on the sentences `changed` directly.
+    """
+    changed = set(changed)
+    linked = set()
+
+    for sentence_id, translation_id in log.values_list('sentence_id', 'translation_id'):
+        changed.add(sentence_id)
+        if translation_id:
+            linked.add(translation_id)
+
+    # A sentence's trans_* fields are built from its direct translations,
+    # so a change to a sentence also changes every sentence linking to it.
+    referrers = set()
+    changed_ids = sorted(changed)
+    for start in range(0, len(changed_ids), DEFAULT_BATCH_SIZE):
+        ids = changed_ids[start:start + DEFAULT_BATCH_SIZE]
+        referrers.update(
+            SentencesTranslations.objects.filter(translation_id__in=ids)\
+                                         .values_list('sentence_id', flat=True)
+            )
+
+    affected = changed | linked | referrers
+    affected.discard(None)
+
+    return affected
+
+
+class Command(BaseCommand):
+    help = ("Reindexes the sentences touched since the last run according "
+            "to the contributions log, the sentences' modified time and the "
+            "added, re-dated and deleted tag links.")
+    option_list = BaseCommand.option_list + (
+        make_option('-b', '--batch-size', action='store', dest='batchsize',
+            default=DEFAULT_BATCH_SIZE, type='int',
+            help='Number of sentences reindexed at once.'
+        ),
+        make_option('-t', '--table', action='store', dest='table',
+            default='contributions', choices=LOG_TABLES.keys(),
+            help='Log table to read from: contributions or last_contributions.'
+        ),
+        make_option('--since-id', action='store', dest='since_id',
+            default=None, type='int',
+            help='Start after this log id instead of the stored mark.'
+        ),
+        make_option('-u', '--using', action='store', dest='using',
+            default='default',
+            help='The haystack connection to update.'
+        ),
+    )
+
+    def handle(self, *args, **options):
+        self.verbosity = int(options.get('verbosity', 1))
+        using = options['using']
+        table = options['table']
+        batch_size = options['batchsize']
+        log_model = LOG_TABLES[table]
+        mark_path = default_mark_path(using)
+        mark = read_mark(mark_path)
+
+        log_high = log_model.objects.aggregate(Max('id'))['id__max'] or 0
+        tags_high = TagsSentences.objects.aggregate(Max('id'))['id__max'] or 0
+        # Timestamps are compared inclusively: a row written during the
+        # previous run in the same second is reindexed again rather than
+        # missed.
+        modified_high = Sentences.objects.aggregate(Max('modified'))['modified__max']
+        added_high = TagsSentences.objects.aggregate(Max('added_time'))['added_time__max']
+        links_path = tag_links_path(mark_path)
+        links = read_tag_links(links_path)
+
+        if options['since_id'] is not None:
+            mark[table] = options['since_id']
+
+        if table not in mark:
+            # Nothing to catch up on before the first run: the index is
+            # expected to come from a full rebuild.
+            mark[table] = log_high
+            mark.setdefault('tags_sentences', tags_high)
+            self.save_mark(mark_path, mark, modified_high, added_high)
+            write_tag_links(links_path, tag_links(TagsSentences.objects.filter(id__lte=tags_high)))
+            if self.verbosity >= 1:
+                self.stdout.write('Starting from %s id %d' % (table, log_high))
+            return
+
+        log = log_model.objects.filter(id__gt=mark[table], id__lte=log_high)
+        tags_mark = mark.get('tags_sentences', tags_high)
+        changed = set()
+
+        new_links = tag_links(TagsSentences.objects.filter(id__gt=tags_mark, id__lte=tags_high))
+        changed.update(new_links[1::2])
+
+        # Without a snapshot from the previous run, deleted links can only
+        # be found from the next one on.
+        removed = removed_tag_links(links, tags_mark) if links is not None else None
+        changed.update(removed or [])
+
+        if removed is None or removed:
+            links = tag_links(TagsSentences.objects.filter(id__lte=tags_mark))
+
+        links.extend(new_links)
+
+        if mark.get('tags_sentences_added'):
+            changed.update(
+                TagsSentences.objects.filter(added_time__gte=parse_datetime(mark['tags_sentences_added']))\
+                                     .values_list('sentence_id', flat=True))
+
+        # Edits made outside the contributions log, like ownership changes,
+        # only show in the modified time.
+        if mark.get('sentences_modified'):
+            changed.update(
+                Sentences.objects.filter(modified__gte=parse_datetime(mark['sentences_modified']))\
+                                 .values_list('id', flat=True))
+
+        sentence_ids = sorted(affected_sentences(log, changed))
+
+        if self.verbosity >= 1:
+            self.stdout.write('Reindexing %d sentences' % len(sentence_ids))
+
+        if TRANSLATION_AGGREGATES:
+            refresh_translation_aggregates(sentence_ids, batch_size)
+
+        backend = haystack_connections[using].get_backend()
+        index = haystack_connections[using].get_unified_index().get_index(Sentences)
+
+        for start in range(0, len(sentence_ids), batch_size):
+            ids = sentence_ids[start:start + batch_size]
+            objects = list(index.index_queryset(using=using).filter(id__in=ids))
+
+            if objects:
+                backend.update(index, objects)
+
+            found = set(obj.id for obj in objects)
+            for sentence_id in ids:
+                if sentence_id not in found:
+                    backend.remove('tatoeba2.sentences.%d' % sentence_id)
+
+        mark[table] = log_high
+        mark['tags_sentences'] = tags_high
+        self.save_mark(mark_path, mark, modified_high, added_high)
+        write_tag_links(links_path, links)
+
+    def save_mark(self, mark_path, mark, modified_high, added_high):
+        if modified_high is not None:
+            mark['sentences_modified'] = modified_high.isoformat()
+        if added_high is not None:
+            mark['tags_sentences_added'] = added_high.isoformat()
+
+        write_mark(mark_path, mark)
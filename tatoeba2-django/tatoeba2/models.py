@@ -227,6 +227,16 @@ class SentencesTranslations(models.Model):
         db_table = 'sentences_translations'
         unique_together = ('sentence_id', 'translation_id')
 
+class SentencesTranslationAggregates(models.Model):
+    sentence_id = models.IntegerField(primary_key=True)
+    trans_langs = models.CharField(max_length=1000)
+    trans_owners = models.TextField()
+    trans_has_audio = models.BooleanField(default=False)
+    trans_is_unapproved = models.BooleanField(default=False)
+    trans_has_orphan = models.BooleanField(default=False)
+    class Meta:
+        db_table = 'sentences_translation_aggregates'
+
 class SinogramSubglyphs(models.Model):
     sinogram_id = models.IntegerField()
     glyph = models.CharField(max_length=2, blank=True)
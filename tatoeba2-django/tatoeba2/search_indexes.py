@@ -1,11 +1,18 @@
 from haystack import indexes
+from django.db.models import F
 from datetime import datetime
 from .utils import now, stemmer, uclean, limit_string
+from .lookups import usernames, group_names
 from .models import (
     Sentences, Users, SentencesTranslations, UsersLanguages, Tags,
-    TagsSentences, SentencesLists, SentenceComments, Wall, Groups
+    TagsSentences, SentencesLists, SentenceComments, Wall,
+    SentencesTranslationAggregates
     )
 from collections import defaultdict
+from django.conf import settings
+
+
+TRANSLATION_AGGREGATES = getattr(settings, 'HAYSTACK_TRANSLATION_AGGREGATES', False)
 
 
 class LimCharField(indexes.CharField):
@@ -16,6 +23,23 @@ class LimCharField(indexes.CharField):
         return limit_string(value)
 
 
+class LookupBatchMixin(object):
+    """
+    Warms the shared lookups for a whole batch before haystack prepares
+    its objects one by one. `batch_lookups` lists (lookup, attribute)
+    pairs.
+    """
+    batch_lookups = ()
+
+    def prepare_batch(self, objects):
+        for lookup, attr in self.batch_lookups:
+            lookup.warm(getattr(obj, attr) for obj in objects)
+
+    def clear_batch(self):
+        for lookup, attr in self.batch_lookups:
+            lookup.clear_absent()
+
+
 class SentencesIndex(indexes.SearchIndex, indexes.Indexable):
     text = indexes.CharField(document=True)
     id = indexes.IntegerField(model_attr='id')
@@ -37,6 +61,8 @@ class SentencesIndex(indexes.SearchIndex, indexes.Indexable):
     trans_has_audio = indexes.BooleanField(default=False)
     trans_is_unapproved = indexes.BooleanField(default=False)
 
+    _batch = {}
+
     def get_model(self):
         return Sentences
 
@@ -46,44 +72,99 @@ class SentencesIndex(indexes.SearchIndex, indexes.Indexable):
     def index_queryset(self, using=None):
         return self.get_model().objects.all()
 
-    def prepare(self, object):
-        self.prepared_data = super(SentencesIndex, self).prepare(object)
-
-        text = uclean(object.text)
-        lang = object.lang
-        user = Users.objects.filter(id=object.user_id)
-        user = user[0] if user else None
-        owner = user.username if user else ''
-        owner = uclean(owner)
-        is_orphan = not bool(owner)
-        owner_is_native = bool(
+    def prepare_batch(self, objects):
+        self._batch = self.load_batch(objects)
+
+    def clear_batch(self):
+        self._batch = {}
+        usernames.clear_absent()
+
+    def load_batch(self, objects):
+        """
+        Fetches the owners, native flags, tags and translation properties
+        of a whole batch of sentences with a fixed number of queries.
+        Returns a dict mapping sentence ids to their related data.
+        """
+        ids = [obj.id for obj in objects]
+        user_ids = set(obj.user_id for obj in objects)
+        user_ids.discard(None)
+        batch = {}
+
+        natives = set(
             UsersLanguages.objects.filter(
-                of_user_id=object.user_id, by_user_id=object.user_id,
-                language_code=lang, level=5
-                ).values_list('language_code', flat=True)
+                of_user_id__in=user_ids, by_user_id=F('of_user_id'), level=5
+                ).values_list('of_user_id', 'language_code')
             )
-        tags = Tags.objects.filter(
-                    id__in=TagsSentences.objects\
-                               .filter(sentence_id=object.id)\
-                               .values_list('tag_id', flat=True)\
-                    ).values_list('name', flat=True)
-        tags = list(set(tags))
-        tags = ' | '.join(tags) if tags else ''
-        tags = uclean(tags)
-        is_tagged = bool(tags)
-        is_unapproved = bool(object.correctness == -1)
-        has_audio = bool(object.hasaudio == 'shtooka' or object.hasaudio == 'from_users')
 
-        direct_props = list(Sentences.objects.raw("""
-                        SELECT `s`.`id`, `s`.`user_id`, `s`.`lang`, `s`.`correctness`, `s`.`hasaudio`
+        tag_links = list(
+            TagsSentences.objects.filter(sentence_id__in=ids)\
+                                 .values_list('sentence_id', 'tag_id')
+            )
+        tag_names = dict(
+            Tags.objects.filter(id__in=set(tag_id for _, tag_id in tag_links))\
+                        .values_list('id', 'name')
+            )
+        tags = defaultdict(list)
+        for sentence_id, tag_id in sorted(tag_links, key=lambda link: link[1]):
+            if tag_id in tag_names:
+                tags[sentence_id].append(tag_names[tag_id])
+
+        if TRANSLATION_AGGREGATES:
+            translations = self.load_translation_aggregates(ids)
+        else:
+            translations = self.load_translations(ids)
+
+        owners = usernames.get_many(user_ids)
+
+        by_lang = defaultdict(list)
+        for obj in objects:
+            by_lang[obj.lang].append(obj)
+
+        stems = {}
+        for lang, lang_objects in by_lang.items():
+            texts = [uclean(obj.text) for obj in lang_objects]
+            for obj, stemmed in zip(lang_objects, stemmer.stem_many(texts, lang)):
+                stems[obj.id] = stemmed
+
+        for obj in objects:
+            batch[obj.id] = {
+                'owner': owners.get(obj.user_id, ''),
+                'owner_is_native': (obj.user_id, obj.lang) in natives,
+                'stemmed': stems[obj.id],
+                'tags': tags[obj.id],
+                'translations': translations.get(obj.id),
+                }
+
+        return batch
+
+    def load_translations(self, ids):
+        """
+        Builds the trans_* fields of the given sentences from their direct
+        translations. Sentences without translations are left out.
+        """
+        direct_props = defaultdict(list)
+        user_ids = set()
+
+        if ids:
+            rows = Sentences.objects.raw("""
+                        SELECT `s`.`id`, `s`.`user_id`, `s`.`lang`, `s`.`correctness`, `s`.`hasaudio`,
+                               `t`.`sentence_id` AS `translation_of`
                         FROM `sentences` as `s`
                         JOIN `sentences_translations` as `t`
                         ON `t`.`translation_id` = `s`.id
-                        WHERE `t`.`sentence_id` = %s ;
-                        """, [object.id]))
-        if direct_props:
+                        WHERE `t`.`sentence_id` IN (%s) ;
+                        """ % ', '.join(['%s'] * len(ids)), ids)
+            for prop in rows:
+                direct_props[prop.translation_of].append(prop)
+                user_ids.add(prop.user_id)
+            user_ids.discard(None)
+
+        owners = usernames.get_many(user_ids)
+        translations = {}
+
+        for sentence_id, props_list in direct_props.items():
             props = defaultdict(set)
-            for prop in direct_props:
+            for prop in props_list:
                 for key in ('user_id', 'lang', 'correctness', 'hasaudio'):
                     props[key].add(getattr(prop, key))
 
@@ -94,24 +175,65 @@ class SentencesIndex(indexes.SearchIndex, indexes.Indexable):
                 props['lang'].remove('')
                 props['lang'].add('und')
 
-            trans_langs = ' | '.join(list(props['lang']))
-            trans_is_unapproved = -1 in props['correctness']
             trans_has_orphan = None in props['user_id']
             if trans_has_orphan: props['user_id'].remove(None)
-            users = list(props['user_id'])
-            users = Users.objects.filter(id__in=users).values_list('username', flat=True)
-            trans_owners = ' | '.join(users)
-            trans_has_audio = 'shtooka' in props['hasaudio'] or \
-                              'from_users' in props['hasaudio']
-
-            self.prepared_data['trans_langs'] = trans_langs
-            self.prepared_data['trans_owners'] = trans_owners
-            self.prepared_data['trans_has_audio'] = trans_has_audio
-            self.prepared_data['trans_is_unapproved'] = trans_is_unapproved
-            self.prepared_data['trans_has_orphan'] = trans_has_orphan
+            trans_owners = [
+                owners[user_id] for user_id in sorted(props['user_id'])
+                if user_id in owners
+                ]
+
+            translations[sentence_id] = {
+                'trans_langs': ' | '.join(list(props['lang'])),
+                'trans_owners': ' | '.join(trans_owners),
+                'trans_has_audio': 'shtooka' in props['hasaudio'] or \
+                                   'from_users' in props['hasaudio'],
+                'trans_is_unapproved': -1 in props['correctness'],
+                'trans_has_orphan': trans_has_orphan,
+                }
+
+        return translations
+
+    def load_translation_aggregates(self, ids):
+        """
+        Same as load_translations, read from the table maintained by the
+        build_translation_aggregates command.
+        """
+        translations = {}
+
+        for aggregate in SentencesTranslationAggregates.objects.filter(sentence_id__in=ids):
+            translations[aggregate.sentence_id] = {
+                'trans_langs': aggregate.trans_langs,
+                'trans_owners': aggregate.trans_owners,
+                'trans_has_audio': bool(aggregate.trans_has_audio),
+                'trans_is_unapproved': bool(aggregate.trans_is_unapproved),
+                'trans_has_orphan': bool(aggregate.trans_has_orphan),
+                }
+
+        return translations
+
+    def prepare(self, object):
+        self.prepared_data = super(SentencesIndex, self).prepare(object)
+
+        related = self._batch.get(object.id)
+        if related is None:
+            related = self.load_batch([object])[object.id]
+
+        text = uclean(object.text)
+        owner = uclean(related['owner'])
+        is_orphan = not bool(owner)
+        owner_is_native = related['owner_is_native']
+        tags = list(set(related['tags']))
+        tags = ' | '.join(tags) if tags else ''
+        tags = uclean(tags)
+        is_tagged = bool(tags)
+        is_unapproved = bool(object.correctness == -1)
+        has_audio = bool(object.hasaudio == 'shtooka' or object.hasaudio == 'from_users')
+
+        if related['translations']:
+            self.prepared_data.update(related['translations'])
 
         self.prepared_data['sentence_text'] = text
-        self.prepared_data['sentence_text_stemmed'] = stemmer.stem(text, lang)
+        self.prepared_data['sentence_text_stemmed'] = related['stemmed']
         self.prepared_data['owner'] = owner
         self.prepared_data['is_orphan'] = is_orphan
         self.prepared_data['owner_is_native'] = owner_is_native
@@ -123,7 +245,7 @@ class SentencesIndex(indexes.SearchIndex, indexes.Indexable):
         return self.prepared_data
 
 
-class TagsIndex(indexes.SearchIndex, indexes.Indexable):
+class TagsIndex(LookupBatchMixin, indexes.SearchIndex, indexes.Indexable):
     text = indexes.CharField(document=True)
     id = indexes.IntegerField(model_attr='id')
     name = indexes.CharField(default='')
@@ -132,6 +254,8 @@ class TagsIndex(indexes.SearchIndex, indexes.Indexable):
     user = indexes.CharField(default='')
     created = indexes.DateTimeField(model_attr='created', default=datetime(1,1,1))
 
+    batch_lookups = ((usernames, 'user_id'),)
+
     def get_model(self):
         return Tags
 
@@ -146,8 +270,7 @@ class TagsIndex(indexes.SearchIndex, indexes.Indexable):
 
         name = uclean(object.name)
         description = uclean(object.description) if object.description else ''
-        user = Users.objects.filter(id=object.user_id)
-        user = user[0] if user else ''
+        user = usernames.get(object.user_id, '')
 
         self.prepared_data['name'] = name
         self.prepared_data['name_ngram'] = name
@@ -156,7 +279,7 @@ class TagsIndex(indexes.SearchIndex, indexes.Indexable):
         return self.prepared_data
 
 
-class SentencesListsIndex(indexes.SearchIndex, indexes.Indexable):
+class SentencesListsIndex(LookupBatchMixin, indexes.SearchIndex, indexes.Indexable):
     text = indexes.CharField(document=True)
     id = indexes.IntegerField(model_attr='id')
     name = indexes.CharField(default='')
@@ -166,6 +289,8 @@ class SentencesListsIndex(indexes.SearchIndex, indexes.Indexable):
     modified = indexes.DateTimeField(model_attr='modified', default=datetime(1,1,1))
     created = indexes.DateTimeField(model_attr='created', default=datetime(1,1,1))
 
+    batch_lookups = ((usernames, 'user_id'),)
+
     def get_model(self):
         return SentencesLists
 
@@ -179,8 +304,7 @@ class SentencesListsIndex(indexes.SearchIndex, indexes.Indexable):
         self.prepared_data = super(SentencesListsIndex, self).prepare(object)
 
         name = uclean(object.name)
-        user = Users.objects.filter(id=object.user_id)
-        user = user[0] if user else ''
+        user = usernames.get(object.user_id, '')
         is_public = bool(object.is_public)
 
         self.prepared_data['name'] = name
@@ -191,7 +315,7 @@ class SentencesListsIndex(indexes.SearchIndex, indexes.Indexable):
         return self.prepared_data
 
 
-class SentenceCommentsIndex(indexes.SearchIndex, indexes.Indexable):
+class SentenceCommentsIndex(LookupBatchMixin, indexes.SearchIndex, indexes.Indexable):
     text = indexes.CharField(document=True)
     id = indexes.IntegerField(model_attr='id')
     sentence_id = indexes.IntegerField(model_attr='sentence_id')
@@ -201,6 +325,8 @@ class SentenceCommentsIndex(indexes.SearchIndex, indexes.Indexable):
     modified = indexes.DateTimeField(model_attr='modified', default=datetime(1,1,1))
     hidden = indexes.IntegerField(model_attr='hidden')
 
+    batch_lookups = ((usernames, 'user_id'),)
+
     def get_model(self):
         return SentenceComments
 
@@ -213,15 +339,14 @@ class SentenceCommentsIndex(indexes.SearchIndex, indexes.Indexable):
     def prepare(self, object):
         self.prepared_data = super(SentenceCommentsIndex, self).prepare(object)
 
-        user = Users.objects.filter(id=object.user_id)
-        user = user[0] if user else ''
+        user = usernames.get(object.user_id, '')
 
         self.prepared_data['user'] = user
 
         return self.prepared_data
 
 
-class WallIndex(indexes.SearchIndex, indexes.Indexable):
+class WallIndex(LookupBatchMixin, indexes.SearchIndex, indexes.Indexable):
     text = indexes.CharField(document=True)
     id = indexes.IntegerField(model_attr='id')
     owner = indexes.CharField(default='')
@@ -233,6 +358,8 @@ class WallIndex(indexes.SearchIndex, indexes.Indexable):
     rght = indexes.IntegerField(model_attr='rght', default=0)
     modified = indexes.DateTimeField(model_attr='modified', default=datetime(1,1,1))
 
+    batch_lookups = ((usernames, 'owner'),)
+
     def get_model(self):
         return Wall
 
@@ -245,15 +372,14 @@ class WallIndex(indexes.SearchIndex, indexes.Indexable):
     def prepare(self, object):
         self.prepared_data = super(WallIndex, self).prepare(object)
 
-        user = Users.objects.filter(id=object.owner)
-        owner = user[0] if user else ''
+        owner = usernames.get(object.owner, '')
 
         self.prepared_data['owner'] = owner
 
         return self.prepared_data
 
 
-class UsersIndex(indexes.SearchIndex, indexes.Indexable):
+class UsersIndex(LookupBatchMixin, indexes.SearchIndex, indexes.Indexable):
     text = indexes.CharField(document=True)
     id = indexes.IntegerField(model_attr='id')
     username = indexes.CharField(model_attr='username')
@@ -270,6 +396,8 @@ class UsersIndex(indexes.SearchIndex, indexes.Indexable):
     country_id = indexes.CharField(model_attr='country_id', default='')
     settings = indexes.CharField(model_attr='settings')
 
+    batch_lookups = ((group_names, 'group_id'),)
+
     def get_model(self):
         return Users
 
@@ -282,7 +410,7 @@ class UsersIndex(indexes.SearchIndex, indexes.Indexable):
     def prepare(self, object):
         self.prepared_data = super(UsersIndex, self).prepare(object)
 
-        group = Groups.objects.get(id=object.group_id).name
+        group = group_names.get(object.group_id, '')
         send_notifications = bool(object.send_notifications)
         last_time_active = datetime.fromtimestamp(object.last_time_active)
 
@@ -0,0 +1,105 @@
+from django.db import models
+from haystack import signals
+from .index_queue import IndexQueue
+from .lookups import LOOKUPS
+from .models import (
+    Sentences, SentencesTranslations, TagsSentences, Tags, SentencesLists,
+    SentenceComments, Wall, Users, Groups
+    )
+
+
+def model_label(model):
+    return '%s.%s' % (model._meta.app_label, model._meta.model_name)
+
+
+SENTENCE = 'tatoeba2.sentences'
+
+
+def referring_sentences(sentence_ids):
+    """
+    The sentences whose trans_* fields are built from `sentence_ids`, a
+    list or a values() queryset.
+    """
+    return SentencesTranslations.objects.filter(translation_id__in=sentence_ids)\
+                                        .values_list('sentence_id', flat=True)
+
+
+def user_dependents(user):
+    owned = Sentences.objects.filter(user_id=user.pk)
+    sentence_ids = set(owned.values_list('id', flat=True))
+    sentence_ids.update(referring_sentences(owned.values('id')))
+
+    changes = [(SENTENCE, pk) for pk in sentence_ids]
+
+    for model, field in ((Tags, 'user_id'), (SentencesLists, 'user_id'),
+                         (SentenceComments, 'user_id'), (Wall, 'owner')):
+        label = model_label(model)
+        changes.extend(
+            (label, pk)
+            for pk in model.objects.filter(**{field: user.pk}).values_list('id', flat=True)
+            )
+
+    return changes
+
+
+# Rows of these models are part of the documents of other rows, that must
+# be reindexed along with them: links and tags of the sentences they
+# point to, translations embedded in the trans_* fields of the sentences
+# linking to them, and usernames and group names embedded in the
+# documents of their users' contributions.
+DEPENDENTS = {
+    SentencesTranslations: lambda link: [
+        (SENTENCE, link.sentence_id), (SENTENCE, link.translation_id)
+        ],
+    TagsSentences: lambda link: [(SENTENCE, link.sentence_id)],
+    Sentences: lambda sentence: [
+        (SENTENCE, pk) for pk in referring_sentences([sentence.pk])
+        ],
+    Users: user_dependents,
+    Groups: lambda group: [
+        (model_label(Users), pk)
+        for pk in Users.objects.filter(group_id=group.pk).values_list('id', flat=True)
+        ],
+}
+
+
+class QueuedSignalProcessor(signals.BaseSignalProcessor):
+    """
+    Records saved and deleted objects of indexed models in an IndexQueue
+    instead of updating Xapian inside the request. The
+    process_index_queue command applies them.
+    """
+
+    def setup(self):
+        self.queue = IndexQueue()
+        models.signals.post_save.connect(self.handle_save)
+        models.signals.post_delete.connect(self.handle_delete)
+
+    def teardown(self):
+        models.signals.post_save.disconnect(self.handle_save)
+        models.signals.post_delete.disconnect(self.handle_delete)
+
+    def changes(self, sender, instance, action):
+        indexed = self.connections['default'].get_unified_index().get_indexed_models()
+        changes = []
+
+        # Changes to looked up rows are queued for the worker to drop them
+        # from its lookups, even for models that aren't indexed.
+        if sender in indexed or sender in LOOKUPS:
+            changes.append((model_label(sender), instance.pk, action))
+
+        if sender in DEPENDENTS:
+            changes.extend(
+                (label, pk, 'update') for label, pk in DEPENDENTS[sender](instance))
+
+        return changes
+
+    def handle_save(self, sender, instance, **kwargs):
+        changes = self.changes(sender, instance, 'update')
+        if changes:
+            self.queue.push_many(changes)
+
+    def handle_delete(self, sender, instance, **kwargs):
+        changes = self.changes(sender, instance, 'delete')
+        if changes:
+            self.queue.push_many(changes)
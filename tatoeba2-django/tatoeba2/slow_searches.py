@@ -0,0 +1,189 @@
+"""
+Log of the search requests slower than API_SLOW_SEARCH_MS, with their
+parameters, the normalized SQ tree and the Xapian queries they ran. The
+request thread only puts a record on a bounded in-memory queue; a
+background thread writes them as JSON lines to a rotating file.
+"""
+from contextlib import contextmanager
+from datetime import datetime
+from django.conf import settings
+from logging import Formatter, makeLogRecord
+from logging.handlers import RotatingFileHandler
+from Queue import Queue, Full, Empty
+from threading import Lock, Thread, local
+from time import time
+import atexit
+import json
+import os
+
+
+def default_log_path():
+    path = settings.HAYSTACK_CONNECTIONS['default']['PATH']
+    return getattr(settings, 'API_SLOW_SEARCH_LOG', path.rstrip(os.sep) + '.slow_searches.log')
+
+
+# None disables the log.
+SLOW_SEARCH_MS = getattr(settings, 'API_SLOW_SEARCH_MS', 500)
+LOG_MAX_BYTES = getattr(settings, 'API_SLOW_SEARCH_LOG_BYTES', 10 * 1024 * 1024)
+LOG_BACKUPS = getattr(settings, 'API_SLOW_SEARCH_LOG_BACKUPS', 5)
+QUEUE_SIZE = getattr(settings, 'API_SLOW_SEARCH_QUEUE_SIZE', 1000)
+
+
+def query_value(value):
+    value = getattr(value, 'query_string', value)
+
+    if isinstance(value, (list, tuple, set)):
+        return [query_value(v) for v in value]
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, (int, long, float, bool)) or value is None:
+        return value
+
+    return unicode(value)
+
+
+def query_tree(node):
+    """
+    JSON-friendly form of an SQ tree, with the children of each node
+    sorted so that the same filters give the same tree.
+    """
+    if isinstance(node, tuple):
+        expression, value = node
+        return [expression, query_value(value)]
+
+    children = [
+        query_tree(child) for child in node.children
+        if isinstance(child, tuple) or child.children
+        ]
+
+    return {
+        'op': node.connector,
+        'not': node.negated,
+        'children': sorted(children, key=lambda c: json.dumps(c, sort_keys=True)),
+        }
+
+
+def query_shape(tree):
+    """
+    The filters and operators of a query_tree, without their values.
+    """
+    if isinstance(tree, list):
+        return '%s=?' % tree[0]
+
+    shape = '(%s)' % (' %s ' % tree['op']).join(
+        sorted(query_shape(child) for child in tree['children']))
+
+    return 'NOT ' + shape if tree['not'] else shape
+
+
+class SlowSearchLog(object):
+
+    def __init__(self, path=None, max_bytes=LOG_MAX_BYTES, backups=LOG_BACKUPS,
+                 size=QUEUE_SIZE):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.queue = Queue(size)
+        self.lock = Lock()
+        self.handler = None
+        self.dropped = 0
+
+    def stats(self):
+        return {
+            'queued': self.queue.qsize(),
+            'dropped': self.dropped,
+            }
+
+    def write(self, record):
+        if self.handler is None:
+            self.start()
+
+        try:
+            self.queue.put_nowait(record)
+        except Full:
+            self.dropped += 1
+
+    def start(self):
+        with self.lock:
+            if self.handler is not None:
+                return
+
+            self.handler = RotatingFileHandler(
+                self.path or default_log_path(), maxBytes=self.max_bytes,
+                backupCount=self.backups)
+            self.handler.setFormatter(Formatter('%(message)s'))
+
+            thread = Thread(target=self.run, name='slow-searches')
+            thread.daemon = True
+            thread.start()
+            atexit.register(self.flush)
+
+    def emit(self, record):
+        self.handler.emit(makeLogRecord({'msg': json.dumps(record, sort_keys=True)}))
+
+    def run(self):
+        while True:
+            self.emit(self.queue.get())
+
+    def flush(self):
+        while True:
+            try:
+                self.emit(self.queue.get_nowait())
+            except Empty:
+                return
+
+
+slow_search_log = SlowSearchLog()
+
+_local = local()
+
+
+@contextmanager
+def watch(resource, request):
+    """
+    Logs the searches made by the request handled in the block if it
+    takes more than SLOW_SEARCH_MS.
+    """
+    if SLOW_SEARCH_MS is None:
+        yield
+        return
+
+    _local.record = record = {
+        'resource': resource,
+        'params': dict(request.GET.lists()),
+        'query': None,
+        'searches': [],
+        }
+    started = time()
+
+    try:
+        yield
+    finally:
+        _local.record = None
+        elapsed = (time() - started) * 1000
+
+        if elapsed >= SLOW_SEARCH_MS:
+            if record['query'] is not None:
+                record['query'] = query_tree(record['query'])
+            record['time'] = datetime.utcnow().isoformat()
+            record['elapsed_ms'] = round(elapsed, 2)
+            slow_search_log.write(record)
+
+
+def note_query(query):
+    record = getattr(_local, 'record', None)
+
+    if record is not None:
+        record['query'] = query
+
+
+def note_search(query, hits, seconds):
+    record = getattr(_local, 'record', None)
+
+    if record is not None:
+        description = getattr(query, 'get_description', None)
+        record['searches'].append({
+            'xapian': description() if description else unicode(query),
+            'hits': hits,
+            'ms': round(seconds * 1000, 2),
+            })
@@ -0,0 +1,19 @@
+from haystack import connections
+import pytest
+
+
+@pytest.fixture
+def xapian_backend(tmpdir):
+    """
+    The default search backend, writing to an empty index in `tmpdir`.
+    """
+    pytest.importorskip('xapian')
+
+    original = connections.connections_info['default']
+    connections.connections_info['default'] = dict(
+        original, PATH=str(tmpdir.join('xapian_index')))
+
+    yield connections.reload('default').get_backend()
+
+    connections.connections_info['default'] = original
+    connections.reload('default')
@@ -0,0 +1,79 @@
+from datetime import datetime
+from django.http import QueryDict
+from haystack.query import SearchQuerySet
+from tastypie.exceptions import BadRequest
+from tatoeba2.api_base import SearchPaginator, encode_cursor, decode_cursor
+from tatoeba2.models import Tags
+from tatoeba2.search_indexes import TagsIndex
+import pytest
+
+
+def cursor_pages(objects, limit):
+    """
+    Walks `objects` with cursor pagination, yielding the django_ids of
+    each page.
+    """
+    cursor = ''
+
+    while cursor is not None:
+        request_data = QueryDict('', mutable=True)
+        request_data['cursor'] = cursor
+        page = SearchPaginator(
+            request_data, objects, resource_uri='/0.1/tags_search/',
+            limit=limit).page()
+
+        yield [int(result.django_id) for result in page['objects']]
+
+        next_uri = page['meta']['next']
+        cursor = QueryDict(next_uri.split('?', 1)[1])['cursor'] if next_uri else None
+
+
+def index_tags(backend, created):
+    tags = [
+        Tags(id=i, name='tag%d' % i, description='', created=date, nbrofsentences=0)
+        for i, date in enumerate(created, 1)
+        ]
+    backend.update(TagsIndex(), tags)
+
+
+def test_cursor_roundtrip():
+    value = datetime(2015, 3, 1, 12, 30, 5)
+
+    assert decode_cursor(encode_cursor(value, 42)) == (value, 42)
+    assert decode_cursor(encode_cursor(u'eng', 42)) == (u'eng', 42)
+
+
+@pytest.mark.parametrize('token', [
+    u'\xe9t\xe9', 'not a cursor',
+    'eyJkamFuZ29faWQiOiAxLCAiZGF0ZXRpbWUiOiAibm9uZSJ9',
+    ])
+def test_invalid_cursor(token):
+    with pytest.raises(BadRequest):
+        decode_cursor(token)
+
+
+@pytest.mark.parametrize('order_by', ['created', '-created'])
+def test_cursor_pages_through_same_day_rows(xapian_backend, order_by):
+    created = [
+        datetime(2015, 3, 1, 9, 0, 0),
+        datetime(2015, 3, 1, 12, 0, 0),
+        datetime(2015, 3, 1, 12, 0, 0),
+        datetime(2015, 3, 1, 12, 0, 0),
+        datetime(2015, 3, 1, 18, 30, 0),
+        datetime(2015, 3, 2, 0, 0, 0),
+        datetime(2015, 2, 28, 23, 59, 59),
+        ]
+    index_tags(xapian_backend, created)
+
+    objects = SearchQuerySet().models(Tags).order_by(order_by)
+    pages = list(cursor_pages(objects, 2))
+    ids = [pk for page in pages for pk in page]
+
+    # Ties are broken by django_id, ascending in both directions.
+    descending = order_by.startswith('-')
+    expected = sorted(
+        range(1, len(created) + 1), reverse=descending,
+        key=lambda pk: (created[pk - 1], -pk if descending else pk))
+
+    assert ids == expected
+    assert all(len(page) <= 2 for page in pages)
@@ -0,0 +1,53 @@
+from django.core.management import call_command
+from tatoeba2.generations import (
+    generations_dir, activate, current_generation, list_generations,
+    document_counts
+    )
+from tatoeba2.models import Tags
+from tatoeba2.search_indexes import TagsIndex
+import os
+
+
+FIRST = '20150101-000000'
+
+
+def make_tags(ids):
+    return [
+        Tags(id=i, name='tag%d' % i, description='', nbrofsentences=0)
+        for i in ids
+        ]
+
+
+def link_to_generation(path, name):
+    os.makedirs(generations_dir(path))
+    os.rename(path, os.path.join(generations_dir(path), name))
+    activate(path, name)
+
+
+def test_clear_index_on_generation_symlink(xapian_backend):
+    path = xapian_backend.path
+    xapian_backend.update(TagsIndex(), make_tags(range(1, 4)))
+    link_to_generation(path, FIRST)
+
+    call_command('clear_index', interactive=False, verbosity=0)
+
+    assert os.path.islink(path)
+    assert current_generation(path) != FIRST
+    assert len(list_generations(path)) == 2
+    assert xapian_backend.document_count() == 0
+    # The cleared generation is left untouched for a rollback.
+    first = os.path.join(generations_dir(path), FIRST)
+    assert document_counts(first, [Tags]) == {Tags: 3}
+
+
+def test_rebuild_on_generation_symlink(xapian_backend):
+    path = xapian_backend.path
+    xapian_backend.update(TagsIndex(), make_tags(range(1, 4)))
+    link_to_generation(path, FIRST)
+
+    xapian_backend.clear()
+    xapian_backend.update(TagsIndex(), make_tags(range(1, 6)))
+
+    assert os.path.islink(path)
+    assert document_counts(path, [Tags]) == {Tags: 5}
+    assert xapian_backend.document_count() == 5
@@ -0,0 +1,132 @@
+from django.core.management import call_command
+from haystack import connections, connection_router
+from haystack.query import SearchQuerySet
+from tatoeba2 import index_queue
+from tatoeba2.index_queue import IndexQueue, coalesce
+from tatoeba2.management.commands import process_index_queue
+from tatoeba2.models import SentencesTranslations, Tags, TagsSentences
+from tatoeba2.search_indexes import TagsIndex
+from tatoeba2.signals import QueuedSignalProcessor, SENTENCE
+import pytest
+
+
+@pytest.fixture
+def queue(tmpdir, monkeypatch):
+    path = str(tmpdir.join('queue'))
+    monkeypatch.setattr(index_queue, 'default_queue_path', lambda: path)
+
+    return IndexQueue()
+
+
+@pytest.fixture
+def processor():
+    processor = QueuedSignalProcessor(connections, connection_router)
+
+    yield processor
+
+    processor.teardown()
+
+
+def test_queue_keeps_changes_until_acked(queue):
+    queue.push_many([
+        ('tatoeba2.tags', 1, 'update'),
+        ('tatoeba2.tags', 2, 'update'),
+        ('tatoeba2.tags', 1, 'delete'),
+        ])
+
+    rows = queue.peek(2)
+    assert [row[1:] for row in rows] == [
+        (u'tatoeba2.tags', 1, u'update'), (u'tatoeba2.tags', 2, u'update')]
+    assert len(queue) == 3
+
+    queue.ack(rows[-1][0])
+    assert [row[1:] for row in queue.peek(2)] == [(u'tatoeba2.tags', 1, u'delete')]
+    assert len(queue) == 1
+
+
+def test_queue_replays_changes_after_hold(queue):
+    queue.push('tatoeba2.tags', 1)
+    queue.hold()
+    queue.push('tatoeba2.tags', 2)
+    queue.push('tatoeba2.tags', 3, 'delete')
+
+    rows = queue.peek(10)
+    queue.ack(rows[-1][0])
+    assert len(queue) == 0
+
+    queue.replay()
+    assert [row[1:] for row in queue.peek(10)] == [
+        (u'tatoeba2.tags', 2, u'update'), (u'tatoeba2.tags', 3, u'delete')]
+
+    queue.ack(queue.peek(10)[-1][0])
+    assert len(queue) == 0
+    assert queue.connection.execute('SELECT COUNT(*) FROM `queue`').fetchone()[0] == 0
+
+
+def test_queue_reapplies_batch_replayed_while_applied(queue):
+    queue.hold()
+    queue.push('tatoeba2.tags', 1)
+
+    rows = queue.peek(10)
+    queue.replay()
+    queue.ack(rows[-1][0])
+
+    assert [row[1:] for row in queue.peek(10)] == [(u'tatoeba2.tags', 1, u'update')]
+
+
+def test_coalesce_keeps_last_action():
+    rows = [
+        (1, 'tatoeba2.tags', 1, 'update'),
+        (2, 'tatoeba2.sentences', 5, 'delete'),
+        (3, 'tatoeba2.tags', 1, 'delete'),
+        (4, 'tatoeba2.sentences', 5, 'update'),
+        (5, 'tatoeba2.tags', 2, 'update'),
+        ]
+
+    assert coalesce(rows) == {
+        'tatoeba2.tags': {1: 'delete', 2: 'update'},
+        'tatoeba2.sentences': {5: 'update'},
+        }
+
+
+def test_links_requeue_their_sentences(processor):
+    link = SentencesTranslations(sentence_id=1, translation_id=2)
+    tag_link = TagsSentences(sentence_id=3, tag_id=4, user_id=5)
+
+    assert processor.changes(SentencesTranslations, link, 'delete') == [
+        (SENTENCE, 1, 'update'), (SENTENCE, 2, 'update')]
+    assert processor.changes(TagsSentences, tag_link, 'update') == [
+        (SENTENCE, 3, 'update')]
+    assert processor.changes(Tags, Tags(id=6), 'delete') == [
+        ('tatoeba2.tags', 6, 'delete')]
+
+
+def test_worker_applies_coalesced_changes(xapian_backend, queue):
+    xapian_backend.update(TagsIndex(), [
+        Tags(id=i, name='tag%d' % i, description='', nbrofsentences=0)
+        for i in range(1, 4)
+        ])
+    queue.push_many([
+        ('tatoeba2.tags', 2, 'update'),
+        ('tatoeba2.tags', 2, 'delete'),
+        ('tatoeba2.tags', 3, 'delete'),
+        ])
+
+    call_command('process_index_queue', once=True, verbosity=0)
+
+    assert [int(result.pk) for result in SearchQuerySet().models(Tags)] == [1]
+    assert len(queue) == 0
+
+
+def test_worker_refreshes_translation_aggregates(xapian_backend, monkeypatch):
+    refreshed = []
+    monkeypatch.setattr(process_index_queue, 'TRANSLATION_AGGREGATES', True)
+    monkeypatch.setattr(
+        process_index_queue, 'refresh_translation_aggregates',
+        lambda ids: refreshed.append(sorted(ids)))
+
+    command = process_index_queue.Command()
+    command.using = 'default'
+    command.apply({'tatoeba2.sentences': {7: 'delete', 8: 'delete'}})
+
+    assert refreshed == [[7, 8]]
@@ -0,0 +1,138 @@
+from django.test import RequestFactory
+from haystack.query import SQ
+from itertools import product
+from tatoeba2.api import SentencesSearchResource, TagsSearchResource
+from tatoeba2.slow_searches import query_value
+import pytest
+
+
+sentences = SentencesSearchResource()
+tags = TagsSearchResource()
+
+
+def leaf_key(child):
+    expression, value = child
+    return expression, repr(query_value(value))
+
+
+def leaves(node):
+    if isinstance(node, tuple):
+        return set([leaf_key(node)])
+
+    return set().union(*[leaves(child) for child in node.children])
+
+
+def evaluate(node, truth):
+    """
+    Whether a document matches `node`, given which filters it matches,
+    or None when `node` has no filter.
+    """
+    if isinstance(node, tuple):
+        return truth[leaf_key(node)]
+
+    values = [evaluate(child, truth) for child in node.children]
+    values = [value for value in values if value is not None]
+
+    if not values:
+        return None
+
+    value = all(values) if node.connector == SQ.AND else any(values)
+
+    return not value if node.negated else value
+
+
+def equivalent(a, b):
+    """
+    Whether two SQ trees match the same documents, whatever their shape.
+    """
+    keys = sorted(leaves(a) | leaves(b))
+
+    for values in product([False, True], repeat=len(keys)):
+        truth = dict(zip(keys, values))
+        if evaluate(a, truth) != evaluate(b, truth):
+            return False
+
+    return True
+
+
+def legacy_search_results(resource, request):
+    """
+    What BaseSearchResource.obj_get_list returned before compile_query:
+    one SearchQuerySet per filter group combined with | and &, the AND
+    group replacing the autocomplete one.
+    """
+    sort_expr, autocomp_filters, and_filters, or_filters, not_filters = \
+        resource.parse_filters(request)
+    result = resource.get_object_list(request)
+
+    for fltr, val in autocomp_filters.items():
+        result = result.autocomplete(**{fltr: val})
+
+    if and_filters:
+        stem_lang = and_filters.get('lang') or ''
+        result = resource.apply_filters(
+            request, resource.build_filters(and_filters, stem_lang))
+
+    if or_filters:
+        result = result | resource.apply_filters(
+            request, resource.build_filters(or_filters), 'or')
+
+    if not_filters:
+        result = result & resource.apply_filters(
+            request, resource.build_filters(not_filters), 'not')
+
+    if sort_expr:
+        result = resource.apply_sort(result, sort_expr)
+
+    return result
+
+
+def compiled_filter(resource, params):
+    request = RequestFactory().get('/', params)
+    _, autocomp_filters, and_filters, or_filters, not_filters = \
+        resource.parse_filters(request)
+    result = resource.get_object_list(request)
+    query = resource.compile_query(
+        result, autocomp_filters, and_filters, or_filters, not_filters)
+
+    if query:
+        result = result.filter(query)
+
+    return result.query.query_filter
+
+
+def legacy_filter(resource, params):
+    request = RequestFactory().get('/', params)
+    return legacy_search_results(resource, request).query.query_filter
+
+
+@pytest.mark.parametrize('resource, params', [
+    (tags, {'name_ngram': 'gram poi'}),
+    (sentences, {'sentence_text': 'cat', 'lang': 'eng'}),
+    (sentences, {'sentence_text': 'cat', '|sentence_text': 'dog'}),
+    (sentences, {'|sentence_text': 'cat', '|owner': 'ajip'}),
+    (sentences, {'lang': 'eng', '~owner': 'ajip'}),
+    (sentences, {'~owner': 'ajip', '~lang': 'fra'}),
+    (sentences, {'sentence_text': 'cat', 'lang': 'eng', '|sentence_text': 'dog',
+                 '|lang': 'fra', '~owner': 'ajip', '~tags': 'OK'}),
+    (sentences, {}),
+    ])
+def test_compiled_query_matches_legacy(resource, params):
+    assert equivalent(compiled_filter(resource, params), legacy_filter(resource, params))
+
+
+def test_compiled_query_keeps_autocomplete_with_and_filters():
+    # The legacy code replaced the autocomplete part with the and filters.
+    expected = SQ()
+    expected.children = [
+        legacy_filter(tags, {'name_ngram': 'gram'}), legacy_filter(tags, {'user': 'ajip'})
+        ]
+    compiled = compiled_filter(tags, {'name_ngram': 'gram', 'user': 'ajip'})
+
+    assert not equivalent(legacy_filter(tags, {'name_ngram': 'gram', 'user': 'ajip'}), expected)
+    assert equivalent(compiled, expected)
+
+
+@pytest.mark.parametrize('params', [{'name_ngram': ' '}, {}])
+def test_empty_groups_match_everything(params):
+    assert evaluate(compiled_filter(tags, params), {}) is None
@@ -20,5 +20,6 @@ api.register(UsersResource())
 api.register(UsersSearchResource())
 
 urlpatterns = patterns('',
+    url(r'^_stats/$', 'tatoeba2.views.stats', name='stats'),
     url(r'^', include(api.urls)),
 )
@@ -1,7 +1,10 @@
 from pytz import UTC as utc
 from datetime import datetime
 from django.conf import settings
+from collections import OrderedDict
+from threading import Lock
 import re
+import resource
 
 
 def now():
@@ -22,38 +25,164 @@ def limit_string(string):
         string = LIMIT_RE.sub('<stripped_token>', string)
     return string
 
+
+class LRUCache(object):
+    """
+    Dict-like cache keeping at most `size` entries, evicting the least
+    recently used one first. Counts hits and misses of `get`.
+
+    With `max_bytes`, the total `weigh(value)` of the entries is also
+    kept under it, and values weighing more than it aren't stored.
+    """
+
+    def __init__(self, size, max_bytes=None, weigh=len):
+        self.size = size
+        self.max_bytes = max_bytes
+        self.weigh = weigh
+        self.data = OrderedDict()
+        self.weights = {}
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = Lock()
+
+    def get(self, key, default=None):
+        with self.lock:
+            try:
+                value = self.data.pop(key)
+            except KeyError:
+                self.misses += 1
+                return default
+
+            self.data[key] = value
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        weight = self.weigh(value) if self.max_bytes is not None else 0
+
+        with self.lock:
+            self.pop(key)
+
+            if self.max_bytes is not None and weight > self.max_bytes:
+                return
+
+            self.data[key] = value
+            if weight:
+                self.weights[key] = weight
+                self.bytes += weight
+
+            while len(self.data) > self.size or \
+                    (self.max_bytes is not None and self.bytes > self.max_bytes):
+                self.pop(next(iter(self.data)))
+
+    def pop(self, key):
+        # Callers hold the lock.
+        self.data.pop(key, None)
+        self.bytes -= self.weights.pop(key, 0)
+
+    def discard(self, key):
+        with self.lock:
+            self.pop(key)
+
+    def __contains__(self, key):
+        return key in self.data
+
+    def __len__(self):
+        return len(self.data)
+
+    def clear(self):
+        with self.lock:
+            self.data.clear()
+            self.weights.clear()
+            self.bytes = 0
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        stats = {
+            'size': len(self.data),
+            'max_size': self.size,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': float(self.hits) / lookups if lookups else 0.0,
+        }
+
+        if self.max_bytes is not None:
+            stats['bytes'] = self.bytes
+            stats['max_bytes'] = self.max_bytes
+
+        return stats
+
+
 STEMMERS = getattr(settings, 'HAYSTACK_STEMMERS')
 
 TOKENIZERS = getattr(settings, 'HAYSTACK_TOKENIZERS', {})
 
 STOP_WORDS = getattr(settings, 'HAYSTACK_STOP_WORDS', {})
 
+STEM_CACHE_SIZE = getattr(settings, 'HAYSTACK_STEM_CACHE_SIZE', 50000)
+
 
 class Stemmer(object):
 
-    def __init__(self, lang=None):
+    def __init__(self, lang=None, cache_size=STEM_CACHE_SIZE):
         self.lang = lang
         self.stemmer = STEMMERS.get(lang, None)
         self.tokenizer = TOKENIZERS.get(lang, None)
         self.stop_words = set(STOP_WORDS.get(lang, set()))
+        self.cache_size = cache_size
+        self.caches = {}
 
     def stem(self, text, lang):
+        return self.stem_many([text], lang)[0]
+
+    def stem_many(self, texts, lang):
         lang = lang or self.lang
         stemmer = STEMMERS.get(lang, None) or self.stemmer
 
         if not stemmer:
-            return ''
+            return ['' for text in texts]
+
+        stem_token = self.token_stemmer(stemmer, lang)
+        stemmed_texts = []
+
+        for text in texts:
+            stemmed_text = []
 
-        stemmed_text = []
+            for token in self.tokenize(text):
+                if token not in self.stop_words:
+                    token = stem_token(token)
+                    stemmed_text.append(token)
 
-        for token in self.tokenize(text):
-            if token not in self.stop_words:
-                token = stemmer.stem(token)
-                stemmed_text.append(token)
+            stemmed_texts.append(' '.join(stemmed_text))
 
-        stemmed_text = ' '.join(stemmed_text)
+        return stemmed_texts
 
-        return stemmed_text
+    def token_stemmer(self, stemmer, lang):
+        """
+        Returns a function stemming a single token, memoized in a bounded
+        per-language cache unless the cache size is 0.
+        """
+        if not self.cache_size:
+            return stemmer.stem
+
+        cache = self.caches.get(lang)
+        if cache is None:
+            cache = self.caches[lang] = LRUCache(self.cache_size)
+
+        def stem_token(token):
+            stem = cache.get(token)
+            if stem is None:
+                stem = stemmer.stem(token)
+                cache.set(token, stem)
+            return stem
+
+        return stem_token
+
+    def stats(self):
+        return dict((lang, cache.stats()) for lang, cache in self.caches.items())
 
     def tokenize(self, text):
         tokenizer = self.tokenizer if self.tokenizer else lambda s: s.split()
@@ -62,3 +191,35 @@ class Stemmer(object):
             yield token
 
 stemmer = Stemmer()
+
+
+def queryset_batches(qs, batch_size=1000):
+    """
+    Yields lists of at most `batch_size` objects from `qs` in primary key
+    order. Each list is fetched with its own keyset query, so memory use
+    doesn't depend on the size of the table.
+    """
+    qs = qs.order_by('pk')
+    last_pk = None
+
+    while True:
+        batch = qs if last_pk is None else qs.filter(pk__gt=last_pk)
+        batch = list(batch[:batch_size])
+
+        if not batch:
+            break
+
+        yield batch
+
+        last_pk = batch[-1].pk
+
+def current_rss():
+    """
+    Resident set size of this process in kilobytes.
+    """
+    try:
+        with open('/proc/self/statm') as f:
+            pages = int(f.read().split()[1])
+        return pages * resource.getpagesize() // 1024
+    except (IOError, IndexError, ValueError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
@@ -0,0 +1,32 @@
+from django.conf import settings
+from django.http import Http404, JsonResponse
+from .api_base import search_cache, facet_cache
+from .backends import read_handles
+from .instrumentation import recorder
+from .slow_searches import slow_search_log
+from .utils import stemmer
+
+
+LOCAL_ADDRESSES = ('127.0.0.1', '::1')
+
+
+def stats(request):
+    """
+    In-process performance counters, only served to local clients.
+    """
+    address = request.META.get('REMOTE_ADDR')
+
+    if address not in LOCAL_ADDRESSES and address not in settings.INTERNAL_IPS:
+        raise Http404
+
+    if request.GET.get('clear'):
+        recorder.clear()
+
+    return JsonResponse({
+        'resources': recorder.summary(),
+        'xapian_handles': read_handles.stats(),
+        'search_cache': search_cache.stats(),
+        'facet_cache': facet_cache.stats(),
+        'stemmer_cache': stemmer.stats(),
+        'slow_search_log': slow_search_log.stats(),
+        })